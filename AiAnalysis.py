@@ -0,0 +1,288 @@
+import hashlib
+import os
+import re
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import pandas as pd
+
+from IngestConfig import LOCAL_DATA_DIR
+
+# AI分析的数据压缩：先按门店、周、客户分层做向量化汇总，
+# 再在token预算内挑选代表性明细行，保证提示词大小与数据量无关
+DEFAULT_TOKEN_BUDGET = 6000
+DEFAULT_TOP_N = 200
+
+METRIC_COLUMNS = ['看播时长', '领取积分', '下单金额']
+# 客户分层：按历史累计消费划分
+SEGMENT_BINS = [float('-inf'), 0, 100, 500, 2000, float('inf')]
+SEGMENT_LABELS = ['未消费', '低消费(0-100]', '中消费(100-500]', '高消费(500-2000]', '核心客户(>2000)']
+
+# 模型回复的磁盘缓存，键为 (模型, 提示词哈希)
+RESPONSE_CACHE_DIR = os.path.join(LOCAL_DATA_DIR, 'ai_cache')
+# 缓存的有效期(秒)和最多保留的回复数，超出时删除最久未使用的
+RESPONSE_CACHE_TTL = 7 * 24 * 3600
+RESPONSE_CACHE_MAX_FILES = 500
+# 流式渲染的合并策略：距上次刷新超过该间隔(秒)或新增字符数超过阈值才刷新页面
+RENDER_INTERVAL = 0.1
+RENDER_MIN_CHARS = 200
+
+# 全部门店分店分析（map-reduce）的并发与限速
+DEFAULT_MAX_WORKERS = 4
+DEFAULT_REQUESTS_PER_MINUTE = 20
+
+_CJK_PATTERN = re.compile(r'[　-鿿＀-￯]')
+
+
+def estimate_tokens(text):
+    """
+    粗略估算token数：中文字符按1个token计，其余字符按4个字符1个token计
+    """
+    cjk = len(_CJK_PATTERN.findall(text))
+    return cjk + (len(text) - cjk + 3) // 4
+
+
+def _prepare(df):
+    df = df.copy()
+    # 原始样例数据的下单金额字段名为"金额"
+    if '下单金额' not in df.columns and '金额' in df.columns:
+        df = df.rename(columns={'金额': '下单金额'})
+    for col in METRIC_COLUMNS + ['历史累计消费']:
+        if col in df.columns:
+            df[col] = pd.to_numeric(df[col], errors='coerce').fillna(0)
+    return df
+
+
+def _aggregate(df, by, label):
+    metrics = [col for col in METRIC_COLUMNS if col in df.columns]
+    if by not in df.columns or not metrics:
+        return None
+    agg = df.groupby(by, dropna=False, observed=True)[metrics].sum().round(1)
+    if '用户手机号' in df.columns:
+        agg.insert(0, '客户数', df.groupby(by, dropna=False, observed=True)['用户手机号'].nunique())
+    return f"【{label}汇总】\n" + agg.reset_index().to_csv(sep='\t', index=False)
+
+
+def _select_rows(df, token_budget, top_n):
+    """按下单金额、看播时长排序后取前top_n行，并在token预算内截断"""
+    sort_columns = [col for col in ['下单金额', '看播时长'] if col in df.columns]
+    if sort_columns:
+        df = df.nlargest(top_n, sort_columns)
+    else:
+        df = df.head(top_n)
+    if df.empty:
+        return ''
+    header, *lines = df.to_csv(sep='\t', index=False, float_format='%.1f').splitlines()
+    used = estimate_tokens(header)
+    selected = []
+    for line in lines:
+        used += estimate_tokens(line) + 1
+        if used > token_budget:
+            break
+        selected.append(line)
+    if not selected:
+        return ''
+    return f"【代表性明细（按下单金额取前{len(selected)}行，共{len(df)}行候选）】\n" + "\n".join([header] + selected)
+
+
+def compact_data_for_prompt(df, token_budget=DEFAULT_TOKEN_BUDGET, top_n=DEFAULT_TOP_N):
+    """
+    将DataFrame压缩为AI分析用的文本
+
+    参数:
+    df: 待分析数据
+    token_budget: 文本的token预算
+    top_n: 明细行候选上限
+
+    返回:
+    汇总+代表性明细组成的字符串，估算token数不超过token_budget
+    """
+    df = _prepare(df)
+    sections = [f"【概况】共{len(df)}行数据"
+                + (f"，{df['用户手机号'].nunique()}位客户" if '用户手机号' in df.columns else '')
+                + (f"，{df['门店'].nunique()}家门店" if '门店' in df.columns else '')]
+
+    if '历史累计消费' in df.columns:
+        df['客户分层'] = pd.cut(df['历史累计消费'], bins=SEGMENT_BINS, labels=SEGMENT_LABELS)
+
+    for by, label in [('门店', '门店'), ('周', '周'), ('客户分层', '客户分层')]:
+        section = _aggregate(df, by, label)
+        if section:
+            sections.append(section)
+
+    # 汇总部分超出预算时按顺序丢弃靠后的部分
+    data_str = ''
+    for section in sections:
+        candidate = data_str + section + "\n"
+        if estimate_tokens(candidate) > token_budget:
+            break
+        data_str = candidate
+
+    remaining = token_budget - estimate_tokens(data_str)
+    detail = _select_rows(df.drop(columns=['客户分层'], errors='ignore'), remaining, top_n)
+    if detail:
+        data_str += detail
+    return data_str
+
+
+def response_cache_path(model, prompt, cache_dir=RESPONSE_CACHE_DIR):
+    """返回 (模型, 提示词) 对应的缓存文件路径"""
+    key = hashlib.sha256(f"{model}\n{prompt}".encode('utf-8')).hexdigest()
+    return os.path.join(cache_dir, f"{key}.md")
+
+
+def cached_stream(model, prompt, create_stream, cache_dir=RESPONSE_CACHE_DIR):
+    """
+    以文本片段的形式返回模型回复，命中缓存时直接回放
+
+    参数:
+    model: 模型名称
+    prompt: 提示词
+    create_stream: 无参函数，未命中缓存时调用，返回 chat.completions 的流式响应
+    """
+    path = response_cache_path(model, prompt, cache_dir)
+    try:
+        if time.time() - os.path.getmtime(path) < RESPONSE_CACHE_TTL:
+            with open(path, 'r', encoding='utf-8') as f:
+                text = f.read()
+            # 更新修改时间，清理时按最近使用排序
+            os.utime(path)
+            yield text
+            return
+    except OSError:
+        pass
+
+    parts = []
+    finish_reason = None
+    for chunk in create_stream():
+        if not chunk.choices:
+            continue
+        choice = chunk.choices[0]
+        content = choice.delta.content
+        if content:
+            parts.append(content)
+            yield content
+        if getattr(choice, 'finish_reason', None):
+            finish_reason = choice.finish_reason
+
+    # 只缓存正常结束的非空回复，流中断、被截断或返回空内容时不写入
+    text = ''.join(parts)
+    if not text.strip() or finish_reason != 'stop':
+        return
+    os.makedirs(cache_dir, exist_ok=True)
+    # 每个写入者使用各自的临时文件，并发写同一个键时互不干扰
+    with tempfile.NamedTemporaryFile('w', encoding='utf-8', dir=cache_dir, suffix='.tmp',
+                                     delete=False) as f:
+        f.write(text)
+    os.replace(f.name, path)
+    prune_response_cache(cache_dir)
+
+
+def prune_response_cache(cache_dir=RESPONSE_CACHE_DIR, ttl=RESPONSE_CACHE_TTL,
+                         max_files=RESPONSE_CACHE_MAX_FILES):
+    """删除过期的回复和遗留的临时文件，数量超出上限时删除最久未使用的回复"""
+    now = time.time()
+    entries = []
+    for name in os.listdir(cache_dir):
+        path = os.path.join(cache_dir, name)
+        try:
+            mtime = os.path.getmtime(path)
+            if now - mtime >= ttl:
+                os.remove(path)
+            elif name.endswith('.md'):
+                entries.append((mtime, path))
+        except OSError:
+            pass
+    entries.sort()
+    for _, path in entries[:max(len(entries) - max_files, 0)]:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+
+def render_stream(placeholder, chunks, interval=RENDER_INTERVAL, min_chars=RENDER_MIN_CHARS):
+    """
+    合并流式片段后再刷新placeholder，避免每个片段都重绘整段文本
+
+    返回:
+    完整回复文本
+    """
+    parts = []
+    pending = 0
+    last_render = time.monotonic()
+    for content in chunks:
+        parts.append(content)
+        pending += len(content)
+        now = time.monotonic()
+        if pending >= min_chars or now - last_render >= interval:
+            placeholder.markdown(''.join(parts))
+            pending = 0
+            last_render = now
+    full_response = ''.join(parts)
+    placeholder.markdown(full_response)
+    return full_response
+
+
+class RateLimiter:
+    """令牌桶限速：最多连续放行burst个请求，之后按每分钟requests_per_minute个的速度放行，多个线程共享"""
+
+    def __init__(self, requests_per_minute, burst=1):
+        self.rate = requests_per_minute / 60.0 if requests_per_minute else 0
+        self.burst = max(burst, 1)
+        self._lock = threading.Lock()
+        self._tokens = float(self.burst)
+        self._last_time = time.monotonic()
+
+    def wait(self):
+        if not self.rate:
+            return
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.burst, self._tokens + (now - self._last_time) * self.rate)
+            self._last_time = now
+            # 令牌不足时先记账再等待，后来的线程排在其后
+            self._tokens -= 1
+            wait_time = -self._tokens / self.rate if self._tokens < 0 else 0
+        if wait_time > 0:
+            time.sleep(wait_time)
+
+
+def run_store_analyses(store_data, analyze, max_workers=DEFAULT_MAX_WORKERS):
+    """
+    并发执行各门店的分析（map阶段），按完成顺序返回结果
+
+    参数:
+    store_data: {门店: 压缩后的数据文本}
+    analyze: 函数 analyze(门店, 数据文本) -> 分析结果文本，在工作线程中调用；
+             限速由analyze在真正发起模型请求时自行处理，命中缓存的门店不受限速影响
+    max_workers: 最大并发数
+
+    返回:
+    生成器，依次产出 (门店, 分析结果, 异常)
+    """
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = {executor.submit(analyze, store, data_str): store for store, data_str in store_data.items()}
+        for future in as_completed(futures):
+            store = futures[future]
+            try:
+                yield store, future.result(), None
+            except Exception as e:
+                yield store, None, e
+
+
+def build_summary_data(store_results, token_budget=DEFAULT_TOKEN_BUDGET):
+    """
+    将各门店的分析结果拼接为汇总（reduce阶段）的输入，每个门店平均分配token预算
+    """
+    if not store_results:
+        return ''
+    per_store = max(token_budget // len(store_results), 1)
+    sections = []
+    for store, result in store_results.items():
+        # 超出预算时按字符截断；中文按1字符≈1token计，截断是保守的
+        text = result if estimate_tokens(result) <= per_store else result[:per_store] + '……'
+        sections.append(f"【{store}】\n{text}")
+    return "\n\n".join(sections)
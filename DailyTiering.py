@@ -0,0 +1,211 @@
+"""
+stock_daily 冷热分层
+
+热表 stock_daily 只保留最近 N 个交易日（默认250）所在的月份，更早的整月数据迁移到
+压缩的归档表 stock_daily_archive。筛选查询只扫描热表，索引和缓冲池占用不再随历史增长。
+
+迁移按交易日逐日进行：先复制到归档表并核对行数，记录归档边界，再从热表删除该日。
+归档边界（已归档的最后一个交易日）单独保存在 stock_daily_tier_meta 中，读取接口据此
+按日期范围路由：不晚于边界的查归档表，晚于边界的查热表，迁移过程中读取也不会重复或缺失。
+回填等操作写入热表的早于边界的数据不影响路由，下次分层时并入归档表。
+"""
+HOT_TABLE = 'stock_daily'
+ARCHIVE_TABLE = 'stock_daily_archive'
+META_TABLE = 'stock_daily_tier_meta'
+DEFAULT_HOT_DAYS = 250
+DAILY_COLUMNS = ['ts_code', 'trade_date', 'open', 'high', 'low', 'close', 'pre_close',
+                 'change', 'pct_chg', 'vol', 'amount']
+
+
+def _date_str(value):
+    from TushareData import format_trade_date
+    return format_trade_date(value)
+
+
+def _column_list(columns):
+    return ','.join(f"`{col}`" for col in columns)
+
+
+def _connect():
+    from TushareData import get_db_connection
+    return get_db_connection(charset='utf8mb4', autocommit=True, connect_timeout=60,
+                             read_timeout=600, write_timeout=600)
+
+
+def init_archive(cursor):
+    """创建归档表（与热表结构相同，行压缩存储）"""
+    cursor.execute("SHOW TABLES LIKE %s", (ARCHIVE_TABLE,))
+    if cursor.fetchone():
+        return
+    cursor.execute(f"CREATE TABLE {ARCHIVE_TABLE} LIKE {HOT_TABLE}")
+    cursor.execute(f"ALTER TABLE {ARCHIVE_TABLE} ROW_FORMAT=COMPRESSED KEY_BLOCK_SIZE=8")
+    print(f"已创建归档表 {ARCHIVE_TABLE}")
+
+
+def init_meta(cursor):
+    """创建归档边界表"""
+    cursor.execute(f'''
+        CREATE TABLE IF NOT EXISTS {META_TABLE} (
+            name VARCHAR(50) PRIMARY KEY,
+            value VARCHAR(20) NOT NULL
+        ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4
+    ''')
+
+
+def get_archived_through(cursor):
+    """
+    已归档的最后一个交易日；归档表存在但尚未记录边界时（旧版本归档）取归档表的最大交易日，
+    尚未归档过时返回None
+    """
+    cursor.execute("SHOW TABLES LIKE %s", (META_TABLE,))
+    if cursor.fetchone() is not None:
+        cursor.execute(f"SELECT value FROM {META_TABLE} WHERE name = 'archived_through'")
+        row = cursor.fetchone()
+        if row is not None:
+            return row[0]
+    cursor.execute("SHOW TABLES LIKE %s", (ARCHIVE_TABLE,))
+    if cursor.fetchone() is None:
+        return None
+    cursor.execute(f"SELECT MAX(trade_date) FROM {ARCHIVE_TABLE}")
+    return _date_str(cursor.fetchone()[0])
+
+
+def set_archived_through(cursor, trade_date):
+    """记录归档边界，只前移不后退"""
+    cursor.execute(f'''
+        INSERT INTO {META_TABLE} (name, value) VALUES ('archived_through', %s)
+        ON DUPLICATE KEY UPDATE value = GREATEST(value, VALUES(value))
+    ''', (trade_date,))
+
+
+def get_route_boundary():
+    """
+    路由边界：不晚于该交易日的数据在归档表中；尚未归档过时返回None（全部在热表）
+    """
+    conn = _connect()
+    try:
+        return get_archived_through(conn.cursor())
+    finally:
+        conn.close()
+
+
+def plan_archive_dates(cursor, hot_days=DEFAULT_HOT_DAYS):
+    """
+    需要归档的交易日：第hot_days个最近交易日所在月份之前的全部交易日（整月迁移）
+
+    返回:
+    升序的交易日列表
+    """
+    cursor.execute(f'''
+        SELECT DISTINCT trade_date FROM {HOT_TABLE}
+        ORDER BY trade_date DESC LIMIT 1 OFFSET %s
+    ''', (hot_days - 1,))
+    row = cursor.fetchone()
+    if row is None:
+        return []
+    month_start = _date_str(row[0])[:6] + '01'
+    cursor.execute(f"SELECT DISTINCT trade_date FROM {HOT_TABLE} WHERE trade_date < %s ORDER BY trade_date",
+                   (month_start,))
+    return [_date_str(r[0]) for r in cursor.fetchall()]
+
+
+def archive_trade_date(cursor, trade_date):
+    """
+    将一个交易日从热表迁移到归档表，核对无误后先前移归档边界再删除热表数据
+
+    返回:
+    迁移的行数，核对不一致时返回None且不删除热表数据
+    """
+    columns = _column_list(DAILY_COLUMNS)
+    cursor.execute(f'''
+        INSERT IGNORE INTO {ARCHIVE_TABLE} ({columns})
+        SELECT {columns} FROM {HOT_TABLE} WHERE trade_date = %s
+    ''', (trade_date,))
+    cursor.execute(f"SELECT COUNT(*) FROM {HOT_TABLE} WHERE trade_date = %s", (trade_date,))
+    hot_count = cursor.fetchone()[0]
+    cursor.execute(f"SELECT COUNT(*) FROM {ARCHIVE_TABLE} WHERE trade_date = %s", (trade_date,))
+    archive_count = cursor.fetchone()[0]
+    if archive_count < hot_count:
+        print(f"{trade_date} 归档核对失败: 热表 {hot_count} 行，归档表 {archive_count} 行")
+        return None
+    set_archived_through(cursor, trade_date)
+    cursor.execute(f"DELETE FROM {HOT_TABLE} WHERE trade_date = %s", (trade_date,))
+    return hot_count
+
+
+def run_tiering(hot_days=DEFAULT_HOT_DAYS, dry_run=False):
+    """
+    执行一次分层：将热窗口之外的整月数据迁移到归档表，可重复执行
+
+    返回:
+    {月份: 迁移行数}，出错时返回None
+    """
+    try:
+        conn = _connect()
+        cursor = conn.cursor()
+        dates = plan_archive_dates(cursor, hot_days)
+        if not dates:
+            print(f"热表不超过 {hot_days} 个交易日，无需归档")
+            cursor.close()
+            conn.close()
+            return {}
+        print(f"待归档 {len(dates)} 个交易日: {dates[0]} 至 {dates[-1]}")
+        if dry_run:
+            cursor.close()
+            conn.close()
+            return {}
+
+        init_archive(cursor)
+        init_meta(cursor)
+        moved = {}
+        # 从最早的交易日开始逐日迁移，归档边界逐日前移；
+        # 早于边界的交易日（回填写入热表的数据）并入归档表，边界不变
+        for trade_date in dates:
+            rows = archive_trade_date(cursor, trade_date)
+            if rows is None:
+                break
+            month = trade_date[:6]
+            moved[month] = moved.get(month, 0) + rows
+        for month, rows in moved.items():
+            print(f"{month} 已归档 {rows} 行")
+        cursor.close()
+        conn.close()
+        return moved
+    except Exception as e:
+        print(f"冷热分层执行出错: {e}")
+        return None
+
+
+def build_daily_query(start_date, end_date, columns=None, archived_through=None):
+    """
+    按日期范围路由：不晚于归档边界的部分查归档表，更晚的部分查热表
+
+    返回:
+    (sql, params)
+    """
+    column_sql = _column_list(columns or DAILY_COLUMNS)
+    if archived_through is None:
+        archived_through = get_route_boundary()
+    if archived_through is None or start_date > archived_through:
+        return (f"SELECT {column_sql} FROM {HOT_TABLE} WHERE trade_date BETWEEN %s AND %s",
+                (start_date, end_date))
+    if end_date <= archived_through:
+        return (f"SELECT {column_sql} FROM {ARCHIVE_TABLE} WHERE trade_date BETWEEN %s AND %s",
+                (start_date, end_date))
+    return (f'''
+        SELECT {column_sql} FROM {ARCHIVE_TABLE} WHERE trade_date BETWEEN %s AND %s
+        UNION ALL
+        SELECT {column_sql} FROM {HOT_TABLE} WHERE trade_date > %s AND trade_date <= %s
+    ''', (start_date, archived_through, archived_through, end_date))
+
+
+def read_daily(start_date, end_date, columns=None, chunksize=100000):
+    """
+    统一的日线读取接口，调用方无需关心数据在热表还是归档表
+
+    返回:
+    DataFrame块的生成器
+    """
+    from TushareData import iter_query_chunks
+    query, params = build_daily_query(start_date, end_date, columns)
+    return iter_query_chunks(query, params, chunksize=chunksize)
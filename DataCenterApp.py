@@ -1,39 +1,88 @@
-from odps import ODPS
+import time
+_rerun_start = time.perf_counter()
+import os
+import tempfile
+import uuid
 import streamlit as st
 st.set_page_config(layout="wide", page_title="直播销售数据分析平台")
 import pandas as pd
-from openai import OpenAI
-
-# 通过st.secrets管理ODPS认证信息
-o = ODPS(st.secrets["odps"]["access_key_id"], 
-         st.secrets["odps"]["access_key_secret"], 
-         st.secrets["odps"]["project"],
-         endpoint=st.secrets["odps"]["endpoint"])
-
-def fetch_demo_data(dataset):
-    """从ODPS获取直播数据"""
+from ExportData import (export_lzt_date_by_shop, export_stores_to_zip, DEFAULT_EXPORT_WORKERS,
+                        get_export_job, export_lzt_prefetched, build_lzt_export_csv,
+                        serve_zip_export, prune_static_exports, start_static_export_pruner,
+                        STATIC_EXPORT_DIR)
+from LztLocalStore import sync_local_dataset, load_local_dataset, build_export_data, get_local_ds
+from AiAnalysis import (compact_data_for_prompt, cached_stream, render_stream, run_store_analyses,
+                        RateLimiter, build_summary_data, DEFAULT_TOKEN_BUDGET, DEFAULT_MAX_WORKERS, DEFAULT_REQUESTS_PER_MINUTE)
+from PerfPanel import begin_rerun, end_rerun, add_stage, stage, timed
+from FrameStore import get_frame_store
+
+_import_done = time.perf_counter()
+
+
+@st.cache_resource(show_spinner=False)
+def get_odps_client():
+    """ODPS客户端，进程内只创建一次，创建时做连通性检查"""
+    # odps/openai 导入较慢，延迟到首次使用时导入
+    from odps import ODPS
+    # 通过st.secrets管理ODPS认证信息
+    client = ODPS(st.secrets["odps"]["access_key_id"],
+                  st.secrets["odps"]["access_key_secret"],
+                  st.secrets["odps"]["project"],
+                  endpoint=st.secrets["odps"]["endpoint"])
+    if not client.exist_project(st.secrets["odps"]["project"]):
+        raise RuntimeError(f"ODPS项目不存在或无权访问: {st.secrets['odps']['project']}")
+    return client
+
+
+@st.cache_resource(show_spinner=False)
+def get_static_export_pruner():
+    """进程内只启动一次的过期导出文件清理线程，应用启动后的首次运行即开始清理"""
+    return start_static_export_pruner()
+
+
+@st.cache_resource(show_spinner=False)
+def get_openai_client(api_key, base_url):
+    """OpenAI客户端，进程内按配置复用"""
+    from openai import OpenAI
+    return OpenAI(api_key=api_key, base_url=base_url)
+
+
+@timed("读取本地样例", rows=len)
+def fetch_demo_data(dataset, shop=None):
+    """从本地副本获取直播数据样例"""
     if dataset=="六滋堂会员日历":
-        reader = o.execute_sql("""
-               SELECT  * FROM    yswy_ads.ads_lzt_customer_analysis_30_df WHERE   ds = MAX_PT('yswy_ads.ads_lzt_customer_analysis_30_df') and `门店`='宁波二店（联丰路店）' limit 100
+        if not shop or shop == "全部门店":
+            shop = '宁波二店（联丰路店）'
+        return load_local_dataset(shop).head(100)
 
-           """).open_reader(tunnel=True, limit=False)
 
-        # 转换为DataFrame
-        data = []
-        for record in reader:
-            data.append(record.values)
 
-        columns = [col.name for col in reader.schema.columns]
-        return pd.DataFrame(data, columns=columns)
+@timed("获取门店列表", rows=len)
+def get_lzt_shop():
+    reader =    get_odps_client().execute_sql("""select business_name  from yswy_dwd.yswy_dwd.dim_lzt_shop_df where ds=max_pt('yswy_dwd.yswy_dwd.dim_lzt_shop_df') group by business_name""").open_reader(tunnel=True, limit=False)
+    return [record.values[0] for record in reader]
 
 
+def stream_prompt(prompt, limiter=None):
+    """调用AI并以文本片段返回结果，相同模型和提示词直接回放磁盘缓存；limiter只在真正请求模型时限速"""
+    # 在主线程中读取配置，便于在工作线程中调用
+    config = st.secrets["openai"]
+    model, api_key, base_url = config["model"], config["api_key"], config["base_url"]
+
+    def create_stream():
+        if limiter is not None:
+            limiter.wait()
+        client = get_openai_client(api_key, base_url)
+        return client.chat.completions.create(
+            model=model,
+            messages=[{'role': 'user', 'content': prompt}],
+            stream=True
+        )
 
-def get_lzt_shop():
-    reader =    o.execute_sql("""select business_name  from yswy_dwd.yswy_dwd.dim_lzt_shop_df where ds=max_pt('yswy_dwd.yswy_dwd.dim_lzt_shop_df') group by business_name""").open_reader(tunnel=True, limit=False)
-    return [record.values[0] for record in reader]
+    return cached_stream(model, prompt, create_stream)
 
 
-def analyze_data(data_str):
+def analyze_data(data_str, limiter=None):
     """调用AI分析数据"""
     prompt = f"""
     以下是每日直播看播&下单数据，请分析并总结以下内容：
@@ -42,23 +91,61 @@ def analyze_data(data_str):
     数据如下：
     {data_str}
     """
+    return stream_prompt(prompt, limiter)
 
-    client = OpenAI(api_key=st.secrets["openai"]["api_key"],
-                    base_url=st.secrets["openai"]["base_url"])
-
-    response = client.chat.completions.create(
-        model=st.secrets["openai"]["model"],
-        messages=[{'role': 'user', 'content': prompt}],
-        stream=True
-    )
 
-    return response
+def analyze_all_stores(df, token_budget):
+    """
+    全部门店分析：各门店并发分析后再汇总
+    """
+    config = st.secrets["openai"]
+    # 在主线程中先创建好客户端，工作线程直接复用
+    get_openai_client(config["api_key"], config["base_url"])
+    max_workers = config.get("max_workers", DEFAULT_MAX_WORKERS)
+    # 允许并发数大小的突发，之后按每分钟请求数限速；命中缓存的门店不占用配额
+    limiter = RateLimiter(config.get("requests_per_minute", DEFAULT_REQUESTS_PER_MINUTE), burst=max_workers)
+    store_data = {store: compact_data_for_prompt(store_df, token_budget=token_budget)
+                  for store, store_df in df.groupby('门店')}
+    # 工作线程中不能调用streamlit，这里提前构造好各门店的回复生成器
+    store_streams = {store: analyze_data(data_str, limiter) for store, data_str in store_data.items()}
+
+    st.subheader("各门店分析结果")
+    progress = st.progress(0.0, text=f"已完成 0/{len(store_data)} 家门店")
+    store_results = {}
+    for i, (store, result, error) in enumerate(run_store_analyses(
+            store_data, lambda store, _: ''.join(store_streams[store]),
+            max_workers=max_workers)):
+        progress.progress((i + 1) / len(store_data), text=f"已完成 {i + 1}/{len(store_data)} 家门店")
+        with st.expander(store, expanded=False):
+            if error is not None:
+                st.error(f"{store}分析失败: {error}")
+            else:
+                st.markdown(result)
+                store_results[store] = result
+
+    if not store_results:
+        st.warning("所有门店分析均失败，跳过汇总分析")
+        return None
+    summary_prompt = f"""
+    以下是各门店直播看播&下单数据的分析结果，请汇总并总结以下内容：
+    1.给出整体客户画像及门店间差异
+    2.给出整体运营优化建议
+    各门店分析如下：
+    {build_summary_data(store_results, token_budget)}
+    """
+    st.subheader("AI汇总分析结果")
+    return render_stream(st.empty(), stream_prompt(summary_prompt, limiter))
 
 
 
 
 def main():
+    begin_rerun("DataCenterApp", _rerun_start)
+    add_stage("模块导入", (_import_done - _rerun_start) * 1000)
     st.title("直播销售数据分析平台")
+    # 样例数据存放在进程共享的存储中，session_state只保存句柄
+    frame_store = get_frame_store()
+    get_static_export_pruner()
 
     # 侧边栏配置
     st.sidebar.header("数据筛选")
@@ -81,14 +168,24 @@ def main():
             ["全部门店"] + shop_list if shop_list else ["全部门店"]
         )
 
+    # 预取：展示样例的同时在后台准备完整导出，点击导出时直接使用
+    prefetch = st.sidebar.checkbox("后台预取完整导出",
+                                   value=st.secrets.get("export", {}).get("prefetch", False))
+
     if st.sidebar.button("获取最新数据"):
         with st.spinner("正在获取数据..."):
             # 根据选择的数据集获取不同数据
             if dataset_option == "六滋堂会员日历":
-                if 'current_dataset' not in st.session_state:
-                    df = fetch_demo_data("六滋堂会员日历")  # 使用现有函数
-                    st.session_state['current_dataset'] = dataset_option
-                    st.session_state['data'] = df
+                # 增量同步本地副本：只拉取新增或变化的日期
+                with stage("ODPS增量同步"):
+                    sync_result = sync_local_dataset(get_odps_client())
+                df = fetch_demo_data("六滋堂会员日历", secondary_filter)
+                st.session_state['current_dataset'] = dataset_option
+                st.session_state['current_shop'] = secondary_filter
+                st.session_state['data_handle'] = frame_store.put(df)
+                if not sync_result['cached']:
+                    st.sidebar.caption(f"分区 {sync_result['ds']}：更新 {len(sync_result['changed'])} 天，"
+                                       f"移除 {len(sync_result['removed'])} 天")
                 base_query = """
                                 SELECT  门店,用户昵称,用户手机号,积分,CONCAT_WS(',',添加的企微成员) 添加的企微成员,团长,最后一次消费时间,历史累计消费,日期,周,
                                         round(sum(看播时长),0) as 看播时长,round(sum(领取积分),0) as 领取积分,round(sum(金额),1) as 下单金额,累计看播时长,累计领取积分,累计金额
@@ -115,46 +212,99 @@ def main():
             st.success("数据获取成功！")
 
     # 显示数据
-    if 'data' in st.session_state:
-        df = st.session_state['data']
+    if 'data_handle' in st.session_state:
         current_dataset = st.session_state['current_dataset']
+        df = frame_store.get(st.session_state['data_handle'])
+        if df is None:
+            # 已被淘汰，从本地副本重新读取
+            df = fetch_demo_data(current_dataset, st.session_state.get('current_shop'))
+            st.session_state['data_handle'] = frame_store.put(df)
         st.subheader(f"展示样例数据 - {current_dataset}-点击完全导出数据获得对应全部数据")
-        st.dataframe(df)
-
+        with stage("渲染样例", rows=len(df)):
+            st.dataframe(df)
+
+        export_job = None
+        if prefetch and current_dataset == "六滋堂会员日历":
+            # 按 (数据集, 门店, 本地副本分区) 共享任务，同样条件的会话复用同一份结果
+            # 任务读取的快照与键中的分区一致；期间本地副本同步到新分区时任务失败，下次按新分区重新提交
+            shop = st.session_state.get('current_shop')
+            local_ds = get_local_ds()
+            export_job = get_export_job(
+                (current_dataset, shop, local_ds),
+                lambda: build_lzt_export_csv(build_export_data(load_local_dataset(shop, ds=local_ds))))
+            st.caption("完整导出已就绪" if export_job.done() else "正在后台准备完整导出...")
 
         # 数据导出功能 - 使用Tunnel Download
         if st.button("完全导出数据"):
             with st.spinner("正在通过Tunnel下载数据..."):
                 #导出六滋堂日历数据
-                from ExportData import export_lzt_date_by_shop
-                export_lzt_date_by_shop(st,o)
+                if export_job is not None:
+                    export_lzt_prefetched(st, export_job)
+                elif current_dataset == "六滋堂会员日历":
+                    # 从本地副本导出，不再重新下载30天全量数据
+                    with stage("加载并聚合本地数据") as rec:
+                        export_df = build_export_data(load_local_dataset(st.session_state.get('current_shop')))
+                        rec['rows'] = len(export_df)
+                    export_lzt_date_by_shop(st,get_odps_client(),export_df)
+                else:
+                    export_lzt_date_by_shop(st,get_odps_client())
+
+        # 批量导出：全部门店各一个CSV，打包为ZIP
+        if current_dataset == "六滋堂会员日历" and st.button("批量导出全部门店"):
+            progress = st.progress(0.0, text="正在导出各门店...")
+            if st.get_option("server.enableStaticServing"):
+                # ZIP写入静态目录，下载时直接从磁盘发送
+                os.makedirs(STATIC_EXPORT_DIR, exist_ok=True)
+                prune_static_exports()
+                zip_path = os.path.join(STATIC_EXPORT_DIR, f"{uuid.uuid4().hex}.zip")
+            else:
+                fd, zip_path = tempfile.mkstemp(suffix='.zip')
+                os.close(fd)
+            served_from_disk = False
+            try:
+                with stage("批量导出全部门店") as rec:
+                    export_df = build_export_data(load_local_dataset())
+                    rec['rows'] = len(export_df)
+                    exported = export_stores_to_zip(
+                        export_df, zip_path,
+                        max_workers=st.secrets.get("export", {}).get("max_workers", DEFAULT_EXPORT_WORKERS),
+                        on_progress=lambda done, total, store: progress.progress(
+                            done / total, text=f"已导出 {done}/{total} 家门店：{store}"))
+                served_from_disk = serve_zip_export(st, zip_path, f"{current_dataset}_全部门店.zip")
+            finally:
+                # download_button已将文件读入内存，临时文件立即删除；静态链接的文件按有效期清理
+                if not served_from_disk and os.path.exists(zip_path):
+                    os.remove(zip_path)
+            st.success(f"批量导出完成，共 {len(exported)} 家门店")
+            missing = sorted(set(st.session_state.get('shop_list') or []) - set(exported))
+            if missing:
+                st.caption(f"以下门店近30天无看播数据，未生成文件：{'、'.join(missing)}")
 
 
         # AI分析
         if st.button("开始AI分析"):
             with st.spinner("AI正在分析数据..."):
-                # 转换数据为字符串格式
-                rows = []
-                for _, row in df.iterrows():
-                    rows.append("\t".join([str(item) for item in row]))
-                data_str = "\n".join(rows)
-
-                # 显示分析结果
-                st.subheader("AI分析结果")
-                response_placeholder = st.empty()
-                full_response = ""
-
-                for chunk in analyze_data(data_str):
-                    if not chunk.choices:
-                        continue
-                    if chunk.choices[0].delta.content:
-                        content = chunk.choices[0].delta.content
-                        full_response += content
-                        response_placeholder.markdown(full_response)
+                token_budget = st.secrets["openai"].get("token_budget", DEFAULT_TOKEN_BUDGET)
+                if current_dataset == "六滋堂会员日历" and st.session_state.get('current_shop') == "全部门店":
+                    # 全部门店：分门店并发分析后汇总，避免单次超大请求超时
+                    with stage("AI分门店分析"):
+                        full_response = analyze_all_stores(load_local_dataset(), token_budget)
+                else:
+                    # 压缩数据：汇总 + token预算内的代表性明细
+                    with stage("提示词压缩", rows=len(df)):
+                        data_str = compact_data_for_prompt(df, token_budget=token_budget)
+
+                    # 显示分析结果
+                    st.subheader("AI分析结果")
+                    response_placeholder = st.empty()
+                    with stage("AI分析"):
+                        full_response = render_stream(response_placeholder, analyze_data(data_str))
 
     else:
         st.info("请点击侧边栏'获取最新数据'按钮加载数据")
 
+    end_rerun(show=st.sidebar.checkbox("显示性能面板", value=False))
+
 
 if __name__ == "__main__":
     main()
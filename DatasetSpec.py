@@ -0,0 +1,223 @@
+"""
+声明式的Tushare数据集：一个字典描述接口、主键、分区列和列类型，
+据此建表建索引，并按交易日增量同步、批量写入
+
+新增数据集只需在 DATASETS 中加一项，例如:
+    'daily_basic': {
+        'endpoint': 'daily_basic',        # pro.query 的接口名
+        'table': 'stock_daily_basic',     # 目标表
+        'key': ['ts_code', 'trade_date'], # 主键（聚簇索引）
+        'partition': 'trade_date',        # 增量同步按该列逐日拉取全市场
+        'indexes': [['trade_date']],      # 二级索引
+        'columns': [('ts_code', 'VARCHAR(12)'), ...],
+    }
+"""
+import time
+from datetime import datetime, timedelta
+
+import pandas as pd
+
+# 单次请求返回的最大行数，达到上限时按offset翻页
+DEFAULT_ROW_LIMIT = 6000
+
+# 金额类字段用DECIMAL保证精度，比率类字段用FLOAT节省空间
+_AMOUNT = 'DECIMAL(16, 2)'
+_RATIO = 'FLOAT'
+_VOL = 'INT'
+
+DATASETS = {
+    'daily_basic': {
+        'endpoint': 'daily_basic',
+        'table': 'stock_daily_basic',
+        'key': ['ts_code', 'trade_date'],
+        'partition': 'trade_date',
+        'indexes': [['trade_date']],
+        'columns': [
+            ('ts_code', 'VARCHAR(12) NOT NULL'),
+            ('trade_date', 'DATE NOT NULL'),
+            ('close', 'DECIMAL(8, 2)'),
+            ('turnover_rate', _RATIO),
+            ('turnover_rate_f', _RATIO),
+            ('volume_ratio', _RATIO),
+            ('pe', _RATIO),
+            ('pe_ttm', _RATIO),
+            ('pb', _RATIO),
+            ('ps', _RATIO),
+            ('ps_ttm', _RATIO),
+            ('dv_ratio', _RATIO),
+            ('dv_ttm', _RATIO),
+            ('total_share', _AMOUNT),
+            ('float_share', _AMOUNT),
+            ('free_share', _AMOUNT),
+            ('total_mv', _AMOUNT),
+            ('circ_mv', _AMOUNT),
+        ],
+    },
+    'moneyflow': {
+        'endpoint': 'moneyflow',
+        'table': 'stock_moneyflow',
+        'key': ['ts_code', 'trade_date'],
+        'partition': 'trade_date',
+        'indexes': [['trade_date']],
+        'columns': [
+            ('ts_code', 'VARCHAR(12) NOT NULL'),
+            ('trade_date', 'DATE NOT NULL'),
+            ('buy_sm_vol', _VOL),
+            ('buy_sm_amount', _AMOUNT),
+            ('sell_sm_vol', _VOL),
+            ('sell_sm_amount', _AMOUNT),
+            ('buy_md_vol', _VOL),
+            ('buy_md_amount', _AMOUNT),
+            ('sell_md_vol', _VOL),
+            ('sell_md_amount', _AMOUNT),
+            ('buy_lg_vol', _VOL),
+            ('buy_lg_amount', _AMOUNT),
+            ('sell_lg_vol', _VOL),
+            ('sell_lg_amount', _AMOUNT),
+            ('buy_elg_vol', _VOL),
+            ('buy_elg_amount', _AMOUNT),
+            ('sell_elg_vol', _VOL),
+            ('sell_elg_amount', _AMOUNT),
+            ('net_mf_vol', _VOL),
+            ('net_mf_amount', _AMOUNT),
+        ],
+    },
+}
+
+
+def get_spec(name):
+    if name not in DATASETS:
+        raise KeyError(f"未定义的数据集: {name}，可选: {', '.join(DATASETS)}")
+    return DATASETS[name]
+
+
+def column_names(spec):
+    return [col for col, _ in spec['columns']]
+
+
+def create_table_sql(spec):
+    """根据数据集定义生成建表语句"""
+    lines = [f"`{col}` {col_type}" for col, col_type in spec['columns']]
+    lines.append(f"PRIMARY KEY ({', '.join(spec['key'])})")
+    for columns in spec.get('indexes', []):
+        lines.append(f"KEY idx_{'_'.join(columns)} ({', '.join(columns)})")
+    body = ',\n                '.join(lines)
+    return f'''
+            CREATE TABLE IF NOT EXISTS {spec['table']} (
+                {body}
+            ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4
+        '''
+
+
+def init_dataset(name):
+    """
+    创建数据集对应的表（已存在时跳过）
+
+    返回:
+    是否成功
+    """
+    from TushareData import get_db_connection
+    spec = get_spec(name)
+    try:
+        conn = get_db_connection(charset='utf8mb4', autocommit=True)
+        cursor = conn.cursor()
+        cursor.execute(create_table_sql(spec))
+        cursor.close()
+        conn.close()
+        return True
+    except Exception as e:
+        print(f"创建数据集 {name} 的表失败: {e}")
+        return False
+
+
+def get_last_synced_date(name):
+    """
+    已同步的最新分区日期（YYYYMMDD），表为空时返回None
+    """
+    from TushareData import get_db_connection, format_trade_date
+    spec = get_spec(name)
+    conn = get_db_connection(charset='utf8mb4', autocommit=True)
+    try:
+        cursor = conn.cursor()
+        cursor.execute(f"SELECT MAX({spec['partition']}) FROM {spec['table']}")
+        value = cursor.fetchone()[0]
+        cursor.close()
+    finally:
+        conn.close()
+    return format_trade_date(value)
+
+
+def fetch_partition(pro, name, value, row_limit=DEFAULT_ROW_LIMIT):
+    """
+    拉取一个分区（如某个交易日）的全市场数据，结果达到行数上限时按offset翻页
+
+    返回:
+    DataFrame，失败返回None
+    """
+    spec = get_spec(name)
+    fields = ','.join(column_names(spec))
+    frames = []
+    offset = 0
+    while True:
+        try:
+            df = pro.query(spec['endpoint'], fields=fields, limit=row_limit, offset=offset,
+                           **{spec['partition']: value})
+        except Exception as e:
+            print(f"获取 {name} {value} 数据失败: {e}")
+            return None
+        if df is None:
+            return None
+        frames.append(df)
+        if len(df) < row_limit:
+            break
+        offset += row_limit
+    df = pd.concat(frames, ignore_index=True)
+    # 只保留定义中的列，顺序与建表一致
+    return df.reindex(columns=column_names(spec))
+
+
+def sync_dataset(pro, name, start_date=None, end_date=None):
+    """
+    按交易日增量同步数据集：未指定start_date时从已同步的最新日期之后开始，
+    每个交易日一次请求拉取全市场数据并批量写入
+
+    遇到失败或尚无数据的交易日即停止，保证已同步日期之前没有缺口，下次从该日继续
+
+    返回:
+    (已同步的交易日数, 写入行数)
+    """
+    from TushareData import get_trade_days, save_frame_to_table
+    spec = get_spec(name)
+    if not init_dataset(name):
+        return 0, 0
+
+    end_date = end_date or datetime.now().strftime('%Y%m%d')
+    if start_date is None:
+        last_date = get_last_synced_date(name)
+        if last_date is None:
+            print(f"{name} 尚无数据，请通过 --start 指定起始日期")
+            return 0, 0
+        start_date = (datetime.strptime(last_date, '%Y%m%d') + timedelta(days=1)).strftime('%Y%m%d')
+    if start_date > end_date:
+        print(f"{name} 已是最新")
+        return 0, 0
+
+    trade_days = get_trade_days(pro, start_date, end_date)
+    if trade_days is None:
+        return 0, 0
+
+    synced, total_rows = 0, 0
+    for i, trade_date in enumerate(trade_days):
+        df = fetch_partition(pro, name, trade_date)
+        if df is None or df.empty:
+            print(f"{name} {trade_date} 暂无数据，同步停止")
+            break
+        if not save_frame_to_table(df, spec['table'], f"{name} {trade_date}"):
+            break
+        synced += 1
+        total_rows += len(df)
+        print(f"{name} {trade_date}: {len(df)} 行 ({i + 1}/{len(trade_days)})")
+        # 控制请求频率，避免被限制
+        if (i + 1) % 50 == 0:
+            time.sleep(1)
+    return synced, total_rows
@@ -1,9 +1,18 @@
+import time
+_rerun_start = time.perf_counter()
 import streamlit as st
 import pandas as pd
 import xlsxwriter
 import io
+import threading
 import traceback
-from TushareData import query_stocks_with_double_tail_number
+import weakref
+from datetime import datetime
+from TushareData import query_stocks_with_double_tail_number, init_tushare_api
+from IntradayScreen import build_tracker, IntradaySession, TushareQuoteSource, ReplayQuoteSource
+from PricePanel import open_panel, get_latest_panel_key, query_double_tail_from_panel
+from PerfPanel import begin_rerun, end_rerun, add_stage, stage
+from FrameStore import get_frame_store
 
 # 设置页面为宽屏模式
 st.set_page_config(
@@ -11,6 +20,11 @@ st.set_page_config(
     layout="wide",
     initial_sidebar_state="expanded"
 )
+begin_rerun("DoubleTailStocksApp", _rerun_start)
+add_stage("模块导入", (time.perf_counter() - _rerun_start) * 1000)
+
+# 查询结果存放在进程共享的存储中，session_state只保存句柄
+frame_store = get_frame_store()
 
 # 页面标题
 st.title("📈 股票数据查询平台")
@@ -22,6 +36,11 @@ DATASET_TYPES = {
         "function": query_stocks_with_double_tail_number,
         "description": "查询最近N个交易日内出现最低价为双尾数（如1.33）的股票",
         "columns": ["name", "ts_code", "trade_date", "low"]
+    },
+    "盘中双尾数股票": {
+        "function": build_tracker,
+        "description": "盘中实时跟踪当日最低价，按双尾数条件增量筛选（含当日）",
+        "columns": ["name", "ts_code", "low"]
     }
     # 后续可以在这里添加更多数据集类型
     # "涨停股票": {
@@ -48,31 +67,116 @@ dataset_type = st.sidebar.selectbox(
 
 # 显示当前数据集的描述
 st.sidebar.info(DATASET_TYPES[dataset_type]["description"])
+show_perf = st.sidebar.checkbox("显示性能面板", value=False)
 
 # 根据不同数据集类型设置参数
 if dataset_type == "双尾数股票":
     days = st.sidebar.slider("选择查询天数", min_value=1, max_value=180, value=180,
                             help="查询最近N个交易日内的双尾数股票")
+    use_panel = st.sidebar.checkbox("使用共享价格面板", value=False,
+                                    help="在所有进程共享的内存映射价格面板上筛选，不再查询数据库")
+
+if dataset_type == "盘中双尾数股票":
+    intraday_days = st.sidebar.slider("选择查询天数", min_value=3, max_value=180, value=6,
+                                      help="最近N个交易日（含当日）内的双尾数股票")
+    replay_path = st.sidebar.text_input("回放行情文件（可选）", help="CSV列: time, ts_code, low；留空使用实时行情")
+    poll_interval = st.sidebar.number_input("刷新间隔(秒)", min_value=1, max_value=60, value=5)
+
+# 进程内最多同时保留的盘中跟踪（不同天数或回放文件各占一个）
+MAX_INTRADAY_SESSIONS = 4
+
+
+@st.cache_resource(show_spinner="正在加载价格面板...", max_entries=4)
+def get_price_panel(trade_date, rows):
+    """每个交易日的价格面板在进程内只打开一次，当日行数变化（采集仍在写入）时重新打开"""
+    return open_panel(trade_date, rows=rows)
+
+
+@st.cache_resource
+def get_active_sessions():
+    """进程内正在运行的盘中跟踪，键为 (交易日, 天数, 回放文件)"""
+    return {"lock": threading.Lock(), "sessions": weakref.WeakValueDictionary()}
+
+
+@st.cache_resource(show_spinner="正在加载历史基线...", max_entries=MAX_INTRADAY_SESSIONS)
+def get_intraday_session(trade_date, days, replay_path):
+    """
+    同一交易日、同一参数的盘中跟踪在进程内只创建一次，所有会话共享
+    轮询间隔只决定各会话的刷新频率，不参与共享；换日时停止旧交易日的轮询线程，
+    被缓存淘汰的跟踪回收后轮询线程随之停止
+    """
+    tracker = DATASET_TYPES["盘中双尾数股票"]["function"](days=days, trade_date=trade_date)
+    if tracker is None:
+        return None
+    if replay_path:
+        source = ReplayQuoteSource(replay_path)
+    else:
+        init_tushare_api()
+        source = TushareQuoteSource(list(tracker.names))
+    session = IntradaySession(tracker, source)
+    active = get_active_sessions()
+    with active["lock"]:
+        for key, old in list(active["sessions"].items()):
+            if key[0] != trade_date:
+                old.stop()
+                del active["sessions"][key]
+        active["sessions"][(trade_date, days, replay_path)] = session
+    return session
+
+
+if dataset_type == "盘中双尾数股票":
+    intraday = get_intraday_session(datetime.now().strftime('%Y%m%d'), intraday_days, replay_path.strip())
+
+    @st.fragment(run_every=poll_interval)
+    def show_intraday_candidates():
+        # 只读取共享跟踪器的当前候选集合，不重新执行SQL
+        tracker = intraday.tracker
+        df_live = tracker.snapshot()
+        col1, col2, col3 = st.columns(3)
+        col1.metric("当前候选数", len(df_live))
+        col2.metric("候选集版本", tracker.version)
+        col3.metric("最近更新", tracker.updated_at.strftime('%H:%M:%S') if tracker.updated_at else "-")
+        st.dataframe(df_live, use_container_width=True, height=500)
+        with st.expander("候选变化记录"):
+            for at, added, removed in list(intraday.changes)[:50]:
+                st.write(f"{at} 新增: {', '.join(added) or '-'}；移除: {', '.join(removed) or '-'}")
+        if not intraday.poller.running:
+            st.info("行情轮询已结束")
+
+    st.subheader(f"📡 盘中双尾数股票 - {datetime.now():%Y-%m-%d}")
+    if intraday is None:
+        st.error("加载历史基线失败，请检查数据库配置")
+    else:
+        show_intraday_candidates()
+    st.markdown("---")
+    st.caption("股票数据查询平台 | 作者：yuxiaohui")
+    end_rerun(show=show_perf)
+    st.stop()
 
 # 查询按钮
 if st.sidebar.button("🔍 查询数据", type="primary"):
     with st.spinner("正在查询数据，请稍候..."):
         try:
             # 根据选择的数据集类型调用相应函数
-            if dataset_type == "双尾数股票":
-                df_result = DATASET_TYPES[dataset_type]["function"](days=days)
-            else:
-                # 其他数据集类型的调用方式
-                df_result = DATASET_TYPES[dataset_type]["function"]()
+            with stage("查询") as rec:
+                if dataset_type == "双尾数股票" and use_panel:
+                    panel = get_price_panel(*get_latest_panel_key())
+                    df_result = query_double_tail_from_panel(panel, days=days) if panel is not None else None
+                elif dataset_type == "双尾数股票":
+                    df_result = DATASET_TYPES[dataset_type]["function"](days=days)
+                else:
+                    # 其他数据集类型的调用方式
+                    df_result = DATASET_TYPES[dataset_type]["function"]()
+                rec['rows'] = len(df_result) if df_result is not None else None
             
             if df_result is not None and not df_result.empty:
                 # 保存数据到session_state
-                st.session_state['current_data'] = df_result
+                st.session_state['current_data_handle'] = frame_store.put(df_result)
                 st.session_state['dataset_type'] = dataset_type
                 st.session_state['query_executed'] = True
                 st.success(f"查询完成！共找到 {len(df_result)} 条记录")
             elif df_result is not None and df_result.empty:
-                st.session_state['current_data'] = df_result
+                st.session_state['current_data_handle'] = frame_store.put(df_result)
                 st.session_state['dataset_type'] = dataset_type
                 st.session_state['query_executed'] = True
                 st.warning("查询完成，但未找到符合条件的数据")
@@ -87,10 +191,12 @@ if st.sidebar.button("🔍 查询数据", type="primary"):
 
 # 显示查询结果
 if 'query_executed' in st.session_state and st.session_state['query_executed']:
-    df_data = st.session_state['current_data']
+    df_data = frame_store.get(st.session_state.get('current_data_handle'))
     dataset_type = st.session_state['dataset_type']
     
-    if df_data is not None and not df_data.empty:
+    if df_data is None:
+        st.warning("查询结果已从内存中淘汰，请重新查询")
+    elif not df_data.empty:
         # 显示数据统计信息
         st.subheader("📊 查询结果统计")
         col1, col2 = st.columns(2)
@@ -107,11 +213,12 @@ if 'query_executed' in st.session_state and st.session_state['query_executed']:
         # 使用可展开的数据表格
         with st.expander("点击查看详细数据", expanded=True):
             # 设置表格高度和宽度
-            st.dataframe(
-                df_data,
-                use_container_width=True,
-                height=500
-            )
+            with stage("渲染表格", rows=len(df_data)):
+                st.dataframe(
+                    df_data,
+                    use_container_width=True,
+                    height=500
+                )
         
         # 下载功能
         st.subheader("💾 数据导出")
@@ -130,7 +237,8 @@ if 'query_executed' in st.session_state and st.session_state['query_executed']:
                 buffer.seek(0)
                 return buffer.getvalue()
             
-            csv_data = convert_df_to_csv(df_data)
+            with stage("CSV序列化", rows=len(df_data)):
+                csv_data = convert_df_to_csv(df_data)
             st.download_button(
                 label="📥 下载CSV格式",
                 data=csv_data,
@@ -151,7 +259,8 @@ if 'query_executed' in st.session_state and st.session_state['query_executed']:
             if st.button("📊 生成Excel格式"):
                 with st.spinner("正在生成Excel文件..."):
                     try:
-                        excel_data = convert_df_to_excel(df_data)
+                        with stage("Excel序列化", rows=len(df_data)):
+                            excel_data = convert_df_to_excel(df_data)
                         st.download_button(
                             label="📥 下载Excel格式",
                             data=excel_data,
@@ -213,4 +322,5 @@ else:
 
 # 页面底部
 st.markdown("---")
-st.caption("股票数据查询平台 | 作者：yuxiaohui")
\ No newline at end of file
+st.caption("股票数据查询平台 | 作者：yuxiaohui")
+end_rerun(show=show_perf)
\ No newline at end of file
@@ -1,6 +1,47 @@
+import html
+import os
+import threading
+import time
+import zipfile
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
 import pandas as pd
 
 from functools import cmp_to_key
+from PerfPanel import stage
+
+# 六滋堂会员日历宽表：固定列 + 按(日期, 周)透视的度量列
+LZT_MULTI_COLUMNS = [
+    ('', '', '门店'),
+    ('', '', '用户昵称'),
+    ('', '', '用户手机号'),
+    ('', '', '添加的企微成员'),
+    ('', '', '团长'),
+    ('', '', '最后一次消费时间'),
+    ('', '', '历史累计消费'),
+    ('', '', '积分'),
+    ('', '', '累计看播时长'),
+    ('', '', '累计领取积分'),
+    ('', '', '累计金额')
+]
+LZT_PIVOT_COLUMNS = ['看播时长', '领取积分', '下单金额']
+DEFAULT_EXPORT_WORKERS = 4
+
+# 预取：进程内按key共享的后台导出任务，会话之间复用同一个任务及其结果
+PREFETCH_MAX_JOBS = 8
+_prefetch_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix='export-prefetch')
+_prefetch_jobs = {}
+_prefetch_lock = threading.Lock()
+
+# 启用 server.enableStaticServing 时，批量导出的ZIP放在应用目录的 static/exports 下，
+# 由Streamlit的静态文件服务直接从磁盘分块发送，不读入内存；超过有效期的文件由后台线程定期删除
+STATIC_EXPORT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'static', 'exports')
+STATIC_EXPORT_URL = 'app/static/exports'
+STATIC_EXPORT_TTL = 3600
+# 后台清理的间隔(秒)，文件最多在有效期后再保留这么久
+STATIC_EXPORT_PRUNE_INTERVAL = 300
+# Streamlit静态文件服务的单文件上限，超过时改用download_button
+STATIC_EXPORT_MAX_BYTES = 200 * 1024 * 1024
 # 定义比较函数
 def compare_lzt_date_by_shop(x, y):
     x_v=x[1]
@@ -64,54 +105,206 @@ def df_pivot(df, multi_columns, agg_column, columns_to_pivot, agg_func):
         #累计金额 倒序
 
     return new_df.sort_values(('', '', '累计金额'), ascending=False)
-def export_lzt_date_by_shop(st,o):
+
+def build_lzt_wide_table(df):
+    """六滋堂会员日历明细按(日期, 周)透视为宽表"""
+    return df_pivot(df, LZT_MULTI_COLUMNS, ['日期', '周'], LZT_PIVOT_COLUMNS, 'sum')
+
+def build_lzt_export_csv(df):
+    """
+    明细透视为宽表并编码为GBK CSV，不调用streamlit，可在后台线程中执行
+
+    返回:
+    (csv字节, 宽表行数)
+    """
+    df_export = build_lzt_wide_table(df)
+    return df_export.to_csv(index=False).encode('gbk', errors='ignore'), len(df_export)
+
+def _store_csv_bytes(store_df):
+    # 在工作线程中完成透视和GBK编码，主线程只负责写入ZIP
+    return build_lzt_export_csv(store_df)[0]
+
+def get_export_job(key, build):
+    """
+    取得key对应的后台导出任务：已完成或进行中的任务直接复用，没有或上次失败时提交build
+
+    返回:
+    Future，结果为build的返回值
+    """
+    with _prefetch_lock:
+        job = _prefetch_jobs.get(key)
+        if job is None or (job.done() and job.exception() is not None):
+            job = _prefetch_executor.submit(build)
+            _prefetch_jobs.pop(key, None)
+            _prefetch_jobs[key] = job
+            # 超出上限时淘汰最早的已完成任务，进行中的任务保留
+            for old_key in list(_prefetch_jobs):
+                if len(_prefetch_jobs) <= PREFETCH_MAX_JOBS:
+                    break
+                if old_key != key and _prefetch_jobs[old_key].done():
+                    del _prefetch_jobs[old_key]
+        return job
+
+def export_lzt_prefetched(st, job):
+    """
+    导出预取的结果：已完成则直接提供下载，进行中则等待该任务完成
+    """
+    try:
+        with stage("等待预取导出") as rec:
+            csv_bytes, rows = job.result()
+            rec['rows'] = rows
+        st.download_button(
+            label="下载CSV文件",
+            data=csv_bytes,
+            file_name=f"{st.session_state['current_dataset']}_tunnel_download.csv",
+            mime="text/csv; charset=gbk"
+        )
+        st.success(f"数据导出完成，共 {rows} 行，使用 GBK 编码")
+    except Exception as e:
+        print(f"预取导出失败: {e}")
+        st.error(f"导出失败: {str(e)}")
+
+def _zip_entry_name(store):
+    return ''.join('_' if c in '\\/:*?"<>|' else c for c in str(store)) + '.csv'
+
+def prune_static_exports(export_dir=STATIC_EXPORT_DIR, ttl=STATIC_EXPORT_TTL):
+    """删除静态目录中超过有效期的导出文件（无法得知下载何时完成，按有效期清理）"""
+    if not os.path.isdir(export_dir):
+        return
+    now = time.time()
+    for name in os.listdir(export_dir):
+        path = os.path.join(export_dir, name)
+        try:
+            if now - os.path.getmtime(path) >= ttl:
+                os.remove(path)
+        except OSError:
+            pass
+
+def start_static_export_pruner(export_dir=STATIC_EXPORT_DIR, ttl=STATIC_EXPORT_TTL,
+                               interval=STATIC_EXPORT_PRUNE_INTERVAL):
+    """
+    启动后台线程：立即清理一次过期的导出文件，之后每隔interval秒清理一次
+    没有新的导出时过期文件也会按时删除（文件含客户手机号，不能长期留在公开的静态目录中）
+
+    返回:
+    threading.Event，set()后线程退出
+    """
+    stop = threading.Event()
+
+    def run():
+        while True:
+            try:
+                prune_static_exports(export_dir, ttl)
+            except Exception as e:
+                print(f"清理过期导出文件失败: {e}")
+            if stop.wait(interval):
+                return
+
+    threading.Thread(target=run, name='static-export-pruner', daemon=True).start()
+    return stop
+
+def serve_zip_export(st, zip_path, file_name):
+    """
+    提供ZIP下载：文件在静态目录中且不超过上限时给出静态链接，由静态文件服务从磁盘发送；
+    否则通过download_button提供（Streamlit会将文件读入内存）
+
+    返回:
+    是否由静态文件服务提供，是则文件需保留到有效期结束，否则调用方可立即删除
+    """
+    in_static_dir = os.path.dirname(os.path.abspath(zip_path)) == STATIC_EXPORT_DIR
+    if in_static_dir and os.path.getsize(zip_path) <= STATIC_EXPORT_MAX_BYTES:
+        url = f"{STATIC_EXPORT_URL}/{os.path.basename(zip_path)}"
+        st.markdown(f'<a href="{url}" download="{html.escape(file_name)}">📦 下载ZIP文件</a>',
+                    unsafe_allow_html=True)
+        return True
+    with open(zip_path, 'rb') as archive:
+        st.download_button(
+            label="下载ZIP文件",
+            data=archive,
+            file_name=file_name,
+            mime="application/zip"
+        )
+    return False
+
+def export_stores_to_zip(df, zip_path, max_workers=DEFAULT_EXPORT_WORKERS, on_progress=None):
+    """
+    各门店并行透视并编码为GBK CSV，逐个写入磁盘上的ZIP文件
+    同时在途的门店不超过 max_workers*2 个，内存中只保留这些门店的CSV
+
+    参数:
+    df: 已聚合好的全部门店数据（build_export_data的结果）
+    on_progress: 回调 on_progress(已完成数, 门店总数, 门店)，在调用线程中执行
+
+    返回:
+    导出的门店列表
+    """
+    groups = iter(df.groupby('门店', sort=True))
+    total = df['门店'].nunique()
+    exported = []
+    with zipfile.ZipFile(zip_path, 'w', compression=zipfile.ZIP_DEFLATED) as zf, \
+            ThreadPoolExecutor(max_workers=max_workers) as executor:
+        pending = {}
+
+        def submit_next():
+            for store, store_df in groups:
+                pending[executor.submit(_store_csv_bytes, store_df)] = store
+                return
+
+        for _ in range(max_workers * 2):
+            submit_next()
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                store = pending.pop(future)
+                zf.writestr(_zip_entry_name(store), future.result())
+                exported.append(store)
+                if on_progress is not None:
+                    on_progress(len(exported), total, store)
+                submit_next()
+    return exported
+
+def export_lzt_date_by_shop(st,o,df=None):
+    """
+    导出六滋堂会员日历宽表
+    df: 已聚合好的数据（如本地副本），为None时通过query_sql走Tunnel下载
+    """
     try:
         # 获取对应的SQL查询
-        if 'query_sql' in st.session_state:
-            query_sql = st.session_state['query_sql']
-            # 执行查询并获取reader
-            reader = o.execute_sql(query_sql).open_reader(tunnel=True, limit=False)
-
-            # 转换为DataFrame
-            data = []
-            for record in reader:
-                data.append(record.values)
-
-            columns = [col.name for col in reader.schema.columns]
-            multi_columns = [
-                ('', '', '门店'),
-                ('', '', '用户昵称'),
-                ('', '', '用户手机号'),
-                ('', '', '添加的企微成员'),
-                ('', '', '团长'),
-                ('', '', '最后一次消费时间'),
-                ('', '', '历史累计消费'),
-                ('', '', '积分'),
-                ('', '', '累计看播时长'),
-                ('', '', '累计领取积分'),
-                ('', '', '累计金额')
-
-            ]
-            columns_to_pivot = ['看播时长', '领取积分', '下单金额']
-            df_export = df_pivot(pd.DataFrame(data, columns=columns), multi_columns, ['日期', '周'], columns_to_pivot,
-                                 'sum')
-            file = df_export.to_csv(index=False, encoding='gbk', errors='ignore')
-            df_export.to_csv('D:\\Downloads\\output.csv', index=False, encoding='gbk', errors='ignore')
-            encoding_name = 'GBK'
-            # 简化版本
-            import io
-
-            # 创建字节缓冲区
-            csv_buffer = io.BytesIO()
-
-            # 将DataFrame写入缓冲区（返回None，数据在缓冲区中）
-            df_export.to_csv(csv_buffer, index=False, encoding='gbk', errors='ignore')
-
-            # 重置指针到开始位置
-            csv_buffer.seek(0)
-
-            # 获取字节数据用于下载
-            csv_bytes = csv_buffer.getvalue()
+        if df is not None or 'query_sql' in st.session_state:
+            if df is None:
+                query_sql = st.session_state['query_sql']
+                # 执行查询并获取reader
+                with stage("ODPS Tunnel下载") as rec:
+                    reader = o.execute_sql(query_sql).open_reader(tunnel=True, limit=False)
+
+                    # 转换为DataFrame
+                    data = []
+                    for record in reader:
+                        data.append(record.values)
+
+                    columns = [col.name for col in reader.schema.columns]
+                    df = pd.DataFrame(data, columns=columns)
+                    rec['rows'] = len(df)
+            with stage("透视", rows=len(df)):
+                df_export = build_lzt_wide_table(df)
+            with stage("CSV序列化", rows=len(df_export)):
+                file = df_export.to_csv(index=False, encoding='gbk', errors='ignore')
+                df_export.to_csv('D:\\Downloads\\output.csv', index=False, encoding='gbk', errors='ignore')
+                encoding_name = 'GBK'
+                # 简化版本
+                import io
+
+                # 创建字节缓冲区
+                csv_buffer = io.BytesIO()
+
+                # 将DataFrame写入缓冲区（返回None，数据在缓冲区中）
+                df_export.to_csv(csv_buffer, index=False, encoding='gbk', errors='ignore')
+
+                # 重置指针到开始位置
+                csv_buffer.seek(0)
+
+                # 获取字节数据用于下载
+                csv_bytes = csv_buffer.getvalue()
 
             st.download_button(
                 label="下载CSV文件",
@@ -0,0 +1,154 @@
+"""
+进程内共享的DataFrame存储
+
+会话的 st.session_state 只保存句柄（内容哈希），DataFrame本身存放在进程级的存储中：
+- 存入时压缩列类型：门店、团长、ts_code等重复值多的文本列转为category，整数向下转换；
+  浮点数只有往返float32完全不变时才转为float32（价格等两位小数的值保持float64，导出不出现误差）
+- 内容相同的结果只保存一份，多个会话查询同样的数据共用同一个DataFrame
+- 总内存超过预算时按LRU淘汰，取回时返回None，调用方需重新加载
+
+取回的DataFrame在会话间共享，调用方不能原地修改。
+内存预算默认512MB，可通过环境变量 DATACENTER_FRAME_BUDGET_MB 调整。
+"""
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+DEFAULT_BUDGET_MB = float(os.environ.get('DATACENTER_FRAME_BUDGET_MB', 512))
+# 始终转为category的列
+CATEGORY_COLUMNS = ('门店', '团长', 'ts_code', '周', '日期')
+# 其他文本列的不重复值占比低于该值时转为category
+CATEGORY_MAX_RATIO = 0.5
+def _downcast_float(series):
+    # 往返float32完全一致才转换，取出的值与存入时相同，导出无需再做舍入
+    compact = series.astype(np.float32)
+    original = series.to_numpy(dtype=np.float64)
+    restored = compact.to_numpy(dtype=np.float64)
+    if np.array_equal(original, restored, equal_nan=True):
+        return compact
+    return series
+
+
+def compact_frame(df):
+    """
+    压缩列类型，返回新的DataFrame，不修改原数据
+    """
+    result = {}
+    for col in df.columns:
+        series = df[col]
+        if pd.api.types.is_bool_dtype(series):
+            result[col] = series
+        elif pd.api.types.is_integer_dtype(series):
+            result[col] = pd.to_numeric(series, downcast='integer')
+        elif pd.api.types.is_float_dtype(series):
+            result[col] = _downcast_float(series)
+        elif series.dtype == object and len(series):
+            try:
+                ratio = series.nunique(dropna=False) / len(series)
+            except TypeError:
+                # 列表等不可哈希的值（如添加的企微成员）保持原样
+                result[col] = series
+                continue
+            if col in CATEGORY_COLUMNS or ratio < CATEGORY_MAX_RATIO:
+                result[col] = series.astype('category')
+            else:
+                result[col] = series
+        else:
+            result[col] = series
+    return pd.DataFrame(result, index=df.index)
+
+
+def content_hash(df):
+    """DataFrame内容哈希：列名、索引和每列的值"""
+    digest = hashlib.sha1()
+    digest.update(repr(list(df.columns)).encode('utf-8'))
+    digest.update(pd.util.hash_pandas_object(df.index).to_numpy().tobytes())
+    for col in df.columns:
+        try:
+            hashed = pd.util.hash_pandas_object(df[col], index=False)
+        except TypeError:
+            hashed = pd.util.hash_pandas_object(df[col].astype(str), index=False)
+        digest.update(hashed.to_numpy().tobytes())
+    return digest.hexdigest()
+
+
+class FrameStore:
+    """按内容哈希去重、按LRU淘汰的DataFrame存储，线程安全"""
+
+    def __init__(self, budget_mb=DEFAULT_BUDGET_MB):
+        self.budget_bytes = int(budget_mb * 1024 * 1024)
+        self._frames = OrderedDict()
+        self._sizes = {}
+        self._lock = threading.Lock()
+        self.total_bytes = 0
+        self.hits = 0
+        self.misses = 0
+
+    def put(self, df):
+        """
+        存入DataFrame，内容相同的已存在时直接复用
+
+        返回:
+        句柄（字符串）
+        """
+        handle = content_hash(df)
+        with self._lock:
+            if handle in self._frames:
+                self._frames.move_to_end(handle)
+                self.hits += 1
+                return handle
+        # 压缩在锁外进行，避免阻塞其他会话
+        compact = compact_frame(df)
+        size = int(compact.memory_usage(index=True, deep=True).sum())
+        with self._lock:
+            if handle not in self._frames:
+                self._frames[handle] = compact
+                self._sizes[handle] = size
+                self.total_bytes += size
+                self.misses += 1
+            self._frames.move_to_end(handle)
+            self._evict(keep=handle)
+        return handle
+
+    def get(self, handle):
+        """取回DataFrame，已被淘汰或句柄为None时返回None"""
+        if handle is None:
+            return None
+        with self._lock:
+            df = self._frames.get(handle)
+            if df is not None:
+                self._frames.move_to_end(handle)
+            return df
+
+    def _evict(self, keep):
+        # 从最久未使用的开始淘汰，刚存入的保留（即使单个超出预算）
+        for handle in list(self._frames):
+            if self.total_bytes <= self.budget_bytes:
+                break
+            if handle == keep:
+                continue
+            del self._frames[handle]
+            self.total_bytes -= self._sizes.pop(handle)
+
+    def stats(self):
+        with self._lock:
+            return {'frames': len(self._frames), 'total_mb': round(self.total_bytes / 1024 / 1024, 1),
+                    'budget_mb': round(self.budget_bytes / 1024 / 1024, 1), 'hits': self.hits,
+                    'misses': self.misses}
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_frame_store(budget_mb=DEFAULT_BUDGET_MB):
+    """进程内唯一的存储，预算以首次创建时为准"""
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = FrameStore(budget_mb)
+        return _store
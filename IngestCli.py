@@ -0,0 +1,334 @@
+"""
+股票数据采集命令行入口，不依赖streamlit，可用于cron或常驻调度
+
+用法:
+    python IngestCli.py [--config secrets.toml] [--spool] init
+    python IngestCli.py basic
+    python IngestCli.py backfill --days 180
+    python IngestCli.py daily [--date 20250102] [--missing-only]
+    python IngestCli.py verify [--date 20250102]
+    python IngestCli.py schedule [--at 15:30]
+    python IngestCli.py queue-plan --days 180 [--queue mysql|file:<路径>]
+    python IngestCli.py worker [--queue mysql|file:<路径>] [--follow]
+        （--spool 时默认使用本地文件队列 local_data/queue/<job>.json，数据库不可用时仍可抓取）
+    python IngestCli.py queue-status
+    python IngestCli.py migrate [--table stock_daily] [--drop-old]
+    python IngestCli.py tier [--hot-days 250] [--dry-run]
+    python IngestCli.py sync [daily_basic moneyflow] [--start 20240101]
+    python IngestCli.py replay [--follow]
+    python IngestCli.py dump --start 20200101 --end 20241231 --output stock_daily.csv
+"""
+import argparse
+import os
+import sys
+import time
+from datetime import datetime, timedelta
+
+# 覆盖率低于该比例认为当日数据尚未就绪
+DEFAULT_MIN_COVERAGE = 0.9
+
+
+def _init_pro():
+    from TushareData import init_tushare_api
+    pro = init_tushare_api()
+    if pro is None:
+        print("Tushare API初始化失败")
+        sys.exit(1)
+    return pro
+
+
+def cmd_init(args):
+    from TushareData import init_database
+    return 0 if init_database() else 1
+
+
+def cmd_basic(args):
+    from TushareData import save_stock_basic_to_db
+    save_stock_basic_to_db(_init_pro())
+    return 0
+
+
+def cmd_backfill(args):
+    from TushareData import save_stock_daily_to_db
+    save_stock_daily_to_db(_init_pro(), days=args.days)
+    return 0
+
+
+def cmd_daily(args):
+    from TushareData import update_daily_data
+    update_daily_data(_init_pro(), trade_date=args.date, missing_only=args.missing_only)
+    return 0
+
+
+def cmd_verify(args):
+    from TushareData import verify_daily_data
+    trade_date = args.date or (datetime.now() - timedelta(days=1)).strftime('%Y%m%d')
+    result = verify_daily_data(trade_date)
+    if result is None:
+        return 1
+    daily_count, stock_count = result
+    coverage = daily_count / stock_count if stock_count else 0
+    print(f"{trade_date}: 日线 {daily_count} 条 / 股票 {stock_count} 只，覆盖率 {coverage:.1%}")
+    return 0 if coverage >= args.min_coverage else 2
+
+
+def _queue_spec(args):
+    # 启用暂存区时任务队列也不依赖MySQL
+    if args.queue:
+        return args.queue
+    if args.spool:
+        from IngestConfig import LOCAL_DATA_DIR
+        return 'file:' + os.path.join(LOCAL_DATA_DIR, 'queue', f"{args.job}.json")
+    return 'mysql'
+
+
+def _next_run(now, at):
+    hour, minute = (int(x) for x in at.split(':'))
+    run_time = now.replace(hour=hour, minute=minute, second=0, microsecond=0)
+    if run_time <= now:
+        run_time += timedelta(days=1)
+    # 周末不开盘，顺延到周一
+    while run_time.weekday() >= 5:
+        run_time += timedelta(days=1)
+    return run_time
+
+
+def cmd_schedule(args):
+    """
+    常驻调度：每个交易日收盘后更新当日数据，数据未就绪时间隔重试
+    """
+    from TushareData import update_daily_data, verify_daily_data, is_trade_day
+    pro = _init_pro()
+    while True:
+        run_time = _next_run(datetime.now(), args.at)
+        print(f"下次更新时间: {run_time:%Y-%m-%d %H:%M}")
+        time.sleep(max((run_time - datetime.now()).total_seconds(), 0))
+
+        trade_date = run_time.strftime('%Y%m%d')
+        if not is_trade_day(pro, trade_date):
+            print(f"{trade_date} 非交易日，跳过")
+            continue
+
+        for attempt in range(args.max_retries + 1):
+            # 上一次只抓到部分股票时，重试只补齐缺失的股票
+            update_daily_data(pro, trade_date=trade_date, missing_only=True)
+            if args.spool:
+                # 核对覆盖率前先封存当前段并把暂存区写入MySQL
+                from IngestSpool import enable_spool, replay_spool
+                enable_spool().close()
+                replay_spool()
+            result = verify_daily_data(trade_date)
+            if result and result[1] and result[0] / result[1] >= args.min_coverage:
+                print(f"{trade_date} 数据更新完成: {result[0]}/{result[1]}")
+                break
+            if attempt < args.max_retries:
+                print(f"{trade_date} 数据尚未就绪，{args.retry_interval} 分钟后重试 ({attempt + 1}/{args.max_retries})")
+                time.sleep(args.retry_interval * 60)
+            else:
+                print(f"{trade_date} 数据在重试 {args.max_retries} 次后仍不完整")
+        if args.once:
+            return 0
+
+
+def cmd_queue_plan(args):
+    """按股票代码区间切分回填任务并写入队列"""
+    from TushareData import get_stock_list
+    from WorkQueue import open_queue, plan_backfill_tasks
+    stock_list = get_stock_list(_init_pro())
+    if stock_list is None or stock_list.empty:
+        print("未获取到股票列表数据")
+        return 1
+    end_date = datetime.now()
+    start_date = end_date - timedelta(days=args.days)
+    tasks = plan_backfill_tasks(stock_list['ts_code'].tolist(), start_date.strftime('%Y%m%d'),
+                                end_date.strftime('%Y%m%d'), codes_per_task=args.codes_per_task)
+    queue = open_queue(_queue_spec(args), args.job)
+    queue.init()
+    queue.add_tasks(tasks)
+    print(f"已写入 {len(tasks)} 个回填任务")
+    return 0
+
+
+def cmd_worker(args):
+    """领取并执行回填任务，可在多台机器上同时运行"""
+    from TushareData import (get_stock_list, get_trade_days, iter_code_batches,
+                             get_stock_daily_data_batch, save_daily_frame_to_db)
+    from WorkQueue import open_queue, run_worker
+    pro = _init_pro()
+    stock_list = get_stock_list(pro)
+    if stock_list is None or stock_list.empty:
+        print("未获取到股票列表数据")
+        return 1
+    all_codes = sorted(stock_list['ts_code'].tolist())
+    trade_day_counts = {}
+
+    def process_task(task, lease_lost):
+        codes = [c for c in all_codes if task['ts_code_start'] <= c <= task['ts_code_end']]
+        date_range = (task['start_date'], task['end_date'])
+        if date_range not in trade_day_counts:
+            trade_days = get_trade_days(pro, *date_range)
+            if trade_days is None:
+                raise RuntimeError("获取交易日历失败")
+            trade_day_counts[date_range] = len(trade_days)
+        trade_day_count = trade_day_counts[date_range]
+        failed = []
+        for i, batch in enumerate(iter_code_batches(codes, trade_day_count)):
+            if lease_lost.is_set():
+                return
+            daily_data, batch_failed = get_stock_daily_data_batch(
+                pro, batch, task['start_date'], task['end_date'], trade_day_count=trade_day_count)
+            failed.extend(batch_failed)
+            if not daily_data.empty and not save_daily_frame_to_db(daily_data, f"{batch[0]}~{batch[-1]}"):
+                failed.extend(batch)
+            # 控制请求频率，避免被限制
+            if (i + 1) % 50 == 0:
+                time.sleep(1)
+        if failed:
+            # 写入是幂等的(INSERT IGNORE)，整个任务放回队列重试即可
+            raise RuntimeError(f"{len(failed)} 只股票处理失败: {','.join(failed[:10])}")
+
+    queue = open_queue(_queue_spec(args), args.job)
+    queue.init()
+    run_worker(queue, process_task, lease_seconds=args.lease, follow=args.follow)
+    return 0
+
+
+def cmd_queue_status(args):
+    from WorkQueue import open_queue
+    print(open_queue(_queue_spec(args), args.job).stats())
+    return 0
+
+
+def cmd_dump(args):
+    """流式导出stock_daily到CSV"""
+    from TushareData import dump_stock_daily
+    total = dump_stock_daily(args.output, args.start, args.end, chunksize=args.chunksize)
+    print(f"导出完成，共 {total} 行: {args.output}")
+    return 0
+
+
+def cmd_sync(args):
+    """按数据集定义增量同步，如daily_basic、moneyflow"""
+    from DatasetSpec import DATASETS, sync_dataset
+    pro = _init_pro()
+    for name in args.datasets or list(DATASETS):
+        synced, rows = sync_dataset(pro, name, start_date=args.start, end_date=args.end)
+        print(f"{name} 同步完成: {synced} 个交易日，{rows} 行")
+    return 0
+
+
+def cmd_tier(args):
+    """将热窗口之外的日线数据迁移到归档表"""
+    from DailyTiering import run_tiering
+    return 0 if run_tiering(hot_days=args.hot_days, dry_run=args.dry_run) is not None else 1
+
+
+def cmd_migrate(args):
+    """在线迁移日线表到紧凑结构"""
+    from MigrateStockDaily import migrate_stock_daily
+    return 0 if migrate_stock_daily(args.table, drop_old=args.drop_old, pause=args.pause) else 1
+
+
+def cmd_replay(args):
+    """将暂存区中的数据回放写入MySQL"""
+    from IngestSpool import SPOOL_DIR, replay_spool
+    replayed, rows, remaining = replay_spool(args.spool_dir or SPOOL_DIR, follow=args.follow,
+                                             interval=args.interval)
+    print(f"回放 {replayed} 个段，{rows} 行，剩余 {remaining} 个段")
+    return 0 if remaining == 0 else 1
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="股票数据采集")
+    parser.add_argument('--config', help="TOML配置文件路径，默认读取 .streamlit/secrets.toml")
+    parser.add_argument('--spool', action='store_true',
+                        help="抓取的数据先写入本地暂存区，由 replay 子命令写入MySQL")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    subparsers.add_parser('init', help="创建数据库表").set_defaults(func=cmd_init)
+    subparsers.add_parser('basic', help="更新股票基本信息").set_defaults(func=cmd_basic)
+
+    backfill = subparsers.add_parser('backfill', help="回填最近N天日线数据")
+    backfill.add_argument('--days', type=int, default=120)
+    backfill.set_defaults(func=cmd_backfill)
+
+    daily = subparsers.add_parser('daily', help="更新单个交易日数据")
+    daily.add_argument('--date', help="交易日 YYYYMMDD，默认昨天")
+    daily.add_argument('--missing-only', action='store_true', help="当日已有部分数据时只补齐缺失的股票")
+    daily.set_defaults(func=cmd_daily)
+
+    verify = subparsers.add_parser('verify', help="检查单个交易日数据覆盖率")
+    verify.add_argument('--date', help="交易日 YYYYMMDD，默认昨天")
+    verify.add_argument('--min-coverage', type=float, default=DEFAULT_MIN_COVERAGE)
+    verify.set_defaults(func=cmd_verify)
+
+    schedule = subparsers.add_parser('schedule', help="常驻运行，每个交易日收盘后更新")
+    schedule.add_argument('--at', default='15:30', help="每日更新时间 HH:MM")
+    schedule.add_argument('--min-coverage', type=float, default=DEFAULT_MIN_COVERAGE)
+    schedule.add_argument('--retry-interval', type=int, default=15, help="数据未就绪时的重试间隔(分钟)")
+    schedule.add_argument('--max-retries', type=int, default=8)
+    schedule.add_argument('--once', action='store_true', help="只执行一次后退出")
+    schedule.set_defaults(func=cmd_schedule)
+
+    dump = subparsers.add_parser('dump', help="流式导出日期范围内的日线数据到CSV")
+    dump.add_argument('--start', required=True, help="开始日期 YYYYMMDD")
+    dump.add_argument('--end', required=True, help="结束日期 YYYYMMDD")
+    dump.add_argument('--output', required=True)
+    dump.add_argument('--chunksize', type=int, default=100000)
+    dump.set_defaults(func=cmd_dump)
+
+    migrate = subparsers.add_parser('migrate', help="在线迁移日线表到紧凑结构（DATE主键、按月分区）")
+    migrate.add_argument('--table', default='stock_daily', help="也可迁移归档表 stock_daily_archive")
+    migrate.add_argument('--drop-old', action='store_true', help="切换后删除旧表")
+    migrate.add_argument('--pause', type=float, default=0.0, help="每复制一个交易日后暂停的秒数")
+    migrate.set_defaults(func=cmd_migrate)
+
+    tier = subparsers.add_parser('tier', help="冷热分层：热表只保留最近N个交易日所在月份")
+    tier.add_argument('--hot-days', type=int, default=250)
+    tier.add_argument('--dry-run', action='store_true', help="只显示待归档的交易日")
+    tier.set_defaults(func=cmd_tier)
+
+    sync = subparsers.add_parser('sync', help="按数据集定义增量同步(DatasetSpec.DATASETS)")
+    sync.add_argument('datasets', nargs='*', help="数据集名称，默认全部")
+    sync.add_argument('--start', help="开始日期 YYYYMMDD，默认从已同步的最新日期之后开始")
+    sync.add_argument('--end', help="结束日期 YYYYMMDD，默认今天")
+    sync.set_defaults(func=cmd_sync)
+
+    replay = subparsers.add_parser('replay', help="将本地暂存区的数据批量去重写入MySQL")
+    replay.add_argument('--spool-dir', help="暂存区目录，默认 local_data/spool")
+    replay.add_argument('--follow', action='store_true', help="常驻运行，定期回放新的段文件")
+    replay.add_argument('--interval', type=int, default=30, help="常驻运行时的回放间隔(秒)")
+    replay.set_defaults(func=cmd_replay)
+
+    queue_args = argparse.ArgumentParser(add_help=False)
+    queue_args.add_argument('--queue', help="任务队列: mysql 或 file:<路径>，默认mysql（--spool 时为本地文件队列）")
+    queue_args.add_argument('--job', default='backfill', help="任务名，同一队列中区分不同批次")
+
+    queue_plan = subparsers.add_parser('queue-plan', parents=[queue_args], help="切分回填任务写入队列")
+    queue_plan.add_argument('--days', type=int, default=120)
+    queue_plan.add_argument('--codes-per-task', type=int, default=200)
+    queue_plan.set_defaults(func=cmd_queue_plan)
+
+    worker = subparsers.add_parser('worker', parents=[queue_args], help="领取并执行回填任务")
+    worker.add_argument('--lease', type=int, default=300, help="租约时长(秒)")
+    worker.add_argument('--follow', action='store_true', help="队列为空时继续等待新任务")
+    worker.set_defaults(func=cmd_worker)
+
+    subparsers.add_parser('queue-status', parents=[queue_args], help="查看任务队列状态").set_defaults(
+        func=cmd_queue_status)
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    if args.config:
+        from IngestConfig import set_config_path
+        set_config_path(args.config)
+    if args.spool:
+        from IngestSpool import enable_spool
+        enable_spool()
+    return args.func(args)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,74 @@
+import os
+import sys
+
+# 数据采集的配置读取，不依赖streamlit
+# 在streamlit应用内运行时直接使用st.secrets；
+# 命令行/定时任务中依次读取 DATACENTER_CONFIG 指定的TOML、项目下的 .streamlit/secrets.toml，
+# 最后用环境变量覆盖同名配置项
+CONFIG_ENV = 'DATACENTER_CONFIG'
+# 本地缓存/物化数据的根目录，可通过环境变量 DATACENTER_DATA_DIR 指定
+LOCAL_DATA_DIR = os.environ.get('DATACENTER_DATA_DIR',
+                                os.path.join(os.path.dirname(os.path.abspath(__file__)), 'local_data'))
+DEFAULT_CONFIG_PATHS = [
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), '.streamlit', 'secrets.toml'),
+    os.path.join(os.path.expanduser('~'), '.streamlit', 'secrets.toml'),
+]
+ENV_KEYS = {
+    ('tushare', 'token'): 'TUSHARE_TOKEN',
+    ('mysql', 'host'): 'MYSQL_HOST',
+    ('mysql', 'port'): 'MYSQL_PORT',
+    ('mysql', 'user'): 'MYSQL_USER',
+    ('mysql', 'password'): 'MYSQL_PASSWORD',
+    ('mysql', 'database'): 'MYSQL_DATABASE',
+}
+
+_secrets = None
+
+
+def _load_toml(path):
+    try:
+        import tomllib
+    except ImportError:
+        import tomli as tomllib
+    with open(path, 'rb') as f:
+        return tomllib.load(f)
+
+
+def load_config(path=None):
+    """
+    读取TOML配置并用环境变量覆盖
+
+    参数:
+    path: TOML文件路径，为None时使用环境变量DATACENTER_CONFIG或默认路径
+    """
+    path = path or os.environ.get(CONFIG_ENV)
+    candidates = [path] if path else DEFAULT_CONFIG_PATHS
+    config = {}
+    for candidate in candidates:
+        if candidate and os.path.exists(candidate):
+            config = _load_toml(candidate)
+            break
+
+    for (section, key), env_name in ENV_KEYS.items():
+        if env_name in os.environ:
+            config.setdefault(section, {})[key] = os.environ[env_name]
+    return config
+
+
+def get_secrets():
+    """
+    返回配置，结构与st.secrets一致：config["mysql"]["host"]
+    """
+    global _secrets
+    if 'streamlit' in sys.modules:
+        import streamlit as st
+        return st.secrets
+    if _secrets is None:
+        _secrets = load_config()
+    return _secrets
+
+
+def set_config_path(path):
+    """指定配置文件并重新加载"""
+    global _secrets
+    _secrets = load_config(path)
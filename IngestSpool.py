@@ -0,0 +1,238 @@
+"""
+采集数据的本地暂存区（预写日志）
+
+启用后，抓取到的DataFrame不再直接写MySQL，而是追加到本地段文件并立即fsync，
+抓取循环不再因数据库抖动而停顿；独立的回放进程把段文件批量去重后写入MySQL，
+全部写入成功才删除段文件，数据库长时间不可用也不会丢失已下载的数据。
+
+段文件格式: 连续的记录，每条为 8字节长度(大端) + pickle后的
+{'table', 'label', 'frame'}；写入中的段以 .open 结尾，写满或超时后改名为 .seg，
+回放只处理 .seg 文件。写入进程对自己的 .open 段持有排他锁，回放进程只收走锁已释放
+（写入进程已退出）的 .open 段。进程崩溃时末尾不完整的记录在回放时忽略。
+"""
+import glob
+import os
+import pickle
+import struct
+import threading
+import time
+import uuid
+
+import pandas as pd
+
+from IngestConfig import LOCAL_DATA_DIR
+
+SPOOL_DIR = os.path.join(LOCAL_DATA_DIR, 'spool')
+SEGMENT_BYTES = 64 * 1024 * 1024
+SEGMENT_SECONDS = 60
+# .open 段超过该时间未修改且未被加锁，视为写入进程已退出，回放时一并处理
+STALE_SECONDS = 600
+REPLAY_CHUNK_ROWS = 50000
+_HEADER = struct.Struct('>Q')
+
+# 回放时按主键去重；未列出的表按整行去重
+TABLE_KEYS = {
+    'stock_daily': ['ts_code', 'trade_date'],
+}
+
+
+def _table_key(table):
+    if table in TABLE_KEYS:
+        return TABLE_KEYS[table]
+    from DatasetSpec import DATASETS
+    for spec in DATASETS.values():
+        if spec['table'] == table:
+            return spec['key']
+    return None
+
+
+def _try_lock_segment(f):
+    """对段文件加非阻塞排他锁，已被其他进程持有时返回False；关闭文件或进程退出时释放"""
+    try:
+        if os.name == 'nt':
+            import msvcrt
+            f.seek(0)
+            msvcrt.locking(f.fileno(), msvcrt.LK_NBLCK, 1)
+        else:
+            import fcntl
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        return True
+    except OSError:
+        return False
+
+
+class SpoolWriter:
+    """追加写段文件，线程安全；每个进程使用各自的段文件"""
+
+    def __init__(self, spool_dir=SPOOL_DIR, segment_bytes=SEGMENT_BYTES, segment_seconds=SEGMENT_SECONDS):
+        self.spool_dir = spool_dir
+        self.segment_bytes = segment_bytes
+        self.segment_seconds = segment_seconds
+        self._file = None
+        self._path = None
+        self._opened_at = None
+        self._lock = threading.Lock()
+        os.makedirs(spool_dir, exist_ok=True)
+
+    def _open_segment(self):
+        name = f"{time.strftime('%Y%m%d%H%M%S')}-{os.getpid()}-{uuid.uuid4().hex[:8]}"
+        self._path = os.path.join(self.spool_dir, name + '.open')
+        self._file = open(self._path, 'ab')
+        if not _try_lock_segment(self._file):
+            raise OSError(f"无法锁定段文件 {self._path}")
+        self._opened_at = time.time()
+
+    def _seal(self):
+        if self._file is None:
+            return
+        self._file.close()
+        try:
+            os.replace(self._path, self._path[:-len('.open')] + '.seg')
+        except FileNotFoundError:
+            # 关闭(释放锁)后回放进程已先一步封存
+            pass
+        self._file = None
+        self._path = None
+
+    def append(self, table, frame, label=''):
+        """
+        追加一批数据，落盘(fsync)后返回
+
+        返回:
+        是否写入成功
+        """
+        try:
+            payload = pickle.dumps({'table': table, 'label': label, 'frame': frame},
+                                   protocol=pickle.HIGHEST_PROTOCOL)
+            with self._lock:
+                if self._file is None:
+                    self._open_segment()
+                self._file.write(_HEADER.pack(len(payload)) + payload)
+                self._file.flush()
+                os.fsync(self._file.fileno())
+                if (self._file.tell() >= self.segment_bytes
+                        or time.time() - self._opened_at >= self.segment_seconds):
+                    self._seal()
+            return True
+        except Exception as e:
+            print(f"写入暂存区失败 {label}: {e}")
+            return False
+
+    def close(self):
+        with self._lock:
+            self._seal()
+
+
+def read_segment(path):
+    """
+    读取段文件中的全部完整记录
+
+    返回:
+    记录字典列表
+    """
+    records = []
+    with open(path, 'rb') as f:
+        while True:
+            header = f.read(_HEADER.size)
+            if len(header) < _HEADER.size:
+                break
+            (size,) = _HEADER.unpack(header)
+            payload = f.read(size)
+            if len(payload) < size:
+                print(f"{os.path.basename(path)} 末尾记录不完整，已忽略")
+                break
+            records.append(pickle.loads(payload))
+    return records
+
+
+def _seal_stale_segments(spool_dir):
+    # 写入进程仍持有锁的段即使长时间未修改也不收走；
+    # 同时要求一段时间未修改，避免收走刚创建、尚未加锁的段
+    now = time.time()
+    for path in glob.glob(os.path.join(spool_dir, '*.open')):
+        try:
+            if now - os.path.getmtime(path) < STALE_SECONDS:
+                continue
+            with open(path, 'rb') as f:
+                if not _try_lock_segment(f):
+                    continue
+            os.replace(path, path[:-len('.open')] + '.seg')
+        except OSError:
+            pass
+
+
+def list_segments(spool_dir=SPOOL_DIR):
+    return sorted(glob.glob(os.path.join(spool_dir, '*.seg')))
+
+
+def replay_segment(path, chunk_rows=REPLAY_CHUNK_ROWS):
+    """
+    将一个段文件按表合并、去重后批量写入MySQL，全部成功后删除段文件
+
+    返回:
+    写入的行数，失败返回None（段文件保留，写入幂等，可重复回放）
+    """
+    from TushareData import write_frame_to_table
+    frames = {}
+    for record in read_segment(path):
+        if record['frame'] is not None and not record['frame'].empty:
+            frames.setdefault(record['table'], []).append(record['frame'])
+
+    total = 0
+    for table, table_frames in frames.items():
+        df = pd.concat(table_frames, ignore_index=True)
+        key = _table_key(table)
+        df = df.drop_duplicates(subset=key if key and set(key) <= set(df.columns) else None, keep='last')
+        for start in range(0, len(df), chunk_rows):
+            chunk = df.iloc[start:start + chunk_rows]
+            if not write_frame_to_table(chunk, table, f"{os.path.basename(path)} {table}"):
+                return None
+        total += len(df)
+    os.remove(path)
+    return total
+
+
+def replay_spool(spool_dir=SPOOL_DIR, follow=False, interval=30):
+    """
+    回放暂存区中的全部段文件；同一暂存区同时只有一个回放进程在工作
+
+    返回:
+    (回放成功的段数, 写入行数, 剩余段数)
+    """
+    from WorkQueue import file_lock
+    os.makedirs(spool_dir, exist_ok=True)
+    replayed, rows = 0, 0
+    while True:
+        with file_lock(os.path.join(spool_dir, 'replay.lock')):
+            _seal_stale_segments(spool_dir)
+            for path in list_segments(spool_dir):
+                written = replay_segment(path)
+                if written is None:
+                    # 数据库仍不可用，稍后从该段继续
+                    break
+                replayed += 1
+                rows += written
+                print(f"已回放 {os.path.basename(path)}: {written} 行")
+            remaining = len(list_segments(spool_dir))
+        if not follow:
+            return replayed, rows, remaining
+        time.sleep(interval)
+
+
+_writer = None
+_writer_lock = threading.Lock()
+
+
+def enable_spool(spool_dir=SPOOL_DIR):
+    """
+    让 TushareData.save_frame_to_table 改为写入暂存区，进程退出时封存当前段
+    """
+    import atexit
+    import TushareData
+    global _writer
+    with _writer_lock:
+        if _writer is None:
+            _writer = SpoolWriter(spool_dir)
+            atexit.register(_writer.close)
+            TushareData.set_spool_writer(_writer)
+    return _writer
@@ -0,0 +1,230 @@
+"""
+盘中双尾数筛选：轮询实时行情，增量维护每只股票当日的最低价，
+按 query_stocks_with_double_tail_number 的条件只重新评估最低价发生变化的股票
+
+条件（与日终SQL一致，区间包含当日）：
+    最近N个交易日最低价 == 最近3个交易日最低价，且该最低价为双尾数(x.11, x.22, ... x.99)
+"""
+import threading
+import weakref
+from collections import deque
+from datetime import datetime
+
+import pandas as pd
+
+DOUBLE_TAIL_CENTS = {11, 22, 33, 44, 55, 66, 77, 88, 99}
+# sina实时行情每次最多查询的股票数
+REALTIME_BATCH_SIZE = 50
+DEFAULT_POLL_INTERVAL = 5
+
+
+def to_cents(price):
+    """价格转为整数分，不是两位小数的价格返回None"""
+    if price is None or pd.isna(price):
+        return None
+    cents = round(float(price) * 100)
+    if abs(float(price) * 100 - cents) > 1e-6:
+        return None
+    return cents
+
+
+def is_double_tail(cents):
+    return cents is not None and cents % 100 in DOUBLE_TAIL_CENTS
+
+
+class TushareQuoteSource:
+    """tushare实时行情，按批轮询"""
+
+    def __init__(self, ts_codes, batch_size=REALTIME_BATCH_SIZE):
+        self.ts_codes = list(ts_codes)
+        self.batch_size = batch_size
+
+    def poll(self):
+        """返回DataFrame(ts_code, low)"""
+        import tushare as ts
+        frames = []
+        for i in range(0, len(self.ts_codes), self.batch_size):
+            batch = self.ts_codes[i:i + self.batch_size]
+            try:
+                df = ts.realtime_quote(ts_code=','.join(batch), src='sina')
+            except Exception as e:
+                print(f"获取实时行情失败: {e}")
+                continue
+            if df is not None and not df.empty:
+                df.columns = [col.lower() for col in df.columns]
+                frames.append(df[['ts_code', 'low']])
+        if not frames:
+            return pd.DataFrame(columns=['ts_code', 'low'])
+        return pd.concat(frames, ignore_index=True)
+
+
+class ReplayQuoteSource:
+    """
+    从本地CSV回放行情，用于盘后复盘或测试
+    CSV列: time, ts_code, low；每次poll返回下一个time的全部行
+    """
+
+    def __init__(self, path):
+        df = pd.read_csv(path, dtype={'ts_code': str, 'time': str})
+        self._ticks = [group[['ts_code', 'low']] for _, group in df.groupby('time', sort=True)]
+        self._position = 0
+
+    def poll(self):
+        if self._position >= len(self._ticks):
+            return pd.DataFrame(columns=['ts_code', 'low'])
+        tick = self._ticks[self._position]
+        self._position += 1
+        return tick
+
+    @property
+    def finished(self):
+        return self._position >= len(self._ticks)
+
+
+class DoubleTailTracker:
+    """
+    维护当日候选集合
+
+    baseline_n / baseline_3: 当日之前 N-1 / 2 个交易日的每只股票最低价(DataFrame: ts_code, name, min_low)
+
+    创建时按历史最低价评估全部股票，停牌或尚无行情的股票视为当日没有创新低，
+    与日终SQL的结果一致；之后只有当日最低价下降的股票才重新评估。
+    """
+
+    def __init__(self, baseline_n, baseline_3, trade_date=None):
+        self.trade_date = trade_date or datetime.now().strftime('%Y%m%d')
+        self.names = dict(zip(baseline_n['ts_code'], baseline_n['name']))
+        self._hist_n = {code: to_cents(low) for code, low in zip(baseline_n['ts_code'], baseline_n['min_low'])}
+        self._hist_3 = {code: to_cents(low) for code, low in zip(baseline_3['ts_code'], baseline_3['min_low'])}
+        self._session_low = {}
+        self.candidates = {}
+        self.version = 0
+        self.updated_at = None
+        self._subscribers = []
+        self._lock = threading.Lock()
+        for code in self._hist_n:
+            result = self._evaluate(code)
+            if result is not None:
+                self.candidates[code] = result
+
+    def subscribe(self, callback):
+        """callback(added, removed)，候选集合变化时调用"""
+        self._subscribers.append(callback)
+
+    def _min(self, *values):
+        values = [v for v in values if v is not None]
+        return min(values) if values else None
+
+    def _evaluate(self, code):
+        low = self._session_low.get(code)
+        min_n = self._min(self._hist_n.get(code), low)
+        min_3 = self._min(self._hist_3.get(code), low)
+        if min_n is not None and min_n == min_3 and is_double_tail(min_n):
+            return min_n
+        return None
+
+    def update(self, quotes):
+        """
+        用一批行情更新当日最低价，只对最低价下降的股票重新评估；
+        没有有效行情的股票保持原有评估结果
+
+        返回:
+        (新增候选, 移除候选)
+        """
+        added, removed = [], []
+        with self._lock:
+            for code, low in zip(quotes['ts_code'], quotes['low']):
+                cents = to_cents(low)
+                if cents is None or cents <= 0:
+                    continue
+                previous = self._session_low.get(code)
+                if previous is not None and cents >= previous:
+                    continue
+                self._session_low[code] = cents
+                result = self._evaluate(code)
+                if result is not None:
+                    if self.candidates.get(code) != result:
+                        added.append(code)
+                    self.candidates[code] = result
+                elif code in self.candidates:
+                    del self.candidates[code]
+                    removed.append(code)
+            self.updated_at = datetime.now()
+            if added or removed:
+                self.version += 1
+        if added or removed:
+            for callback in self._subscribers:
+                callback(added, removed)
+        return added, removed
+
+    def snapshot(self):
+        """当前候选集合，列与日终查询结果一致"""
+        with self._lock:
+            rows = [(self.names.get(code), code, cents / 100) for code, cents in self.candidates.items()]
+        return pd.DataFrame(rows, columns=['name', 'ts_code', 'low'])
+
+
+def build_tracker(days=6, trade_date=None):
+    """
+    从数据库加载历史基线并创建跟踪器
+    """
+    from TushareData import query_min_low_before
+    trade_date = trade_date or datetime.now().strftime('%Y%m%d')
+    baseline_n = query_min_low_before(trade_date, max(days - 1, 0))
+    baseline_3 = query_min_low_before(trade_date, 2)
+    if baseline_n is None or baseline_3 is None:
+        return None
+    return DoubleTailTracker(baseline_n, baseline_3, trade_date)
+
+
+class IntradayPoller:
+    """后台线程按固定间隔轮询行情并更新跟踪器"""
+
+    def __init__(self, tracker, source, interval=DEFAULT_POLL_INTERVAL):
+        self.tracker = tracker
+        self.source = source
+        self.interval = interval
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                quotes = self.source.poll()
+                if quotes is not None and not quotes.empty:
+                    self.tracker.update(quotes)
+            except Exception as e:
+                print(f"盘中轮询出错: {e}")
+            if getattr(self.source, 'finished', False):
+                return
+            self._stop.wait(self.interval)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+
+    @property
+    def running(self):
+        return self._thread.is_alive()
+
+
+class IntradaySession:
+    """
+    一组共享的盘中跟踪：跟踪器、轮询线程和最近的候选变化记录
+    轮询线程不引用本对象，本对象被回收（例如被缓存淘汰）时随之停止轮询
+    """
+
+    def __init__(self, tracker, source, interval=DEFAULT_POLL_INTERVAL, max_changes=200):
+        self.tracker = tracker
+        self.changes = deque(maxlen=max_changes)
+        changes = self.changes
+        tracker.subscribe(lambda added, removed: changes.appendleft(
+            (datetime.now().strftime('%H:%M:%S'), added, removed)))
+        self.poller = IntradayPoller(tracker, source, interval=interval).start()
+        weakref.finalize(self, self.poller.stop)
+
+    def stop(self):
+        self.poller.stop()
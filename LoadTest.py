@@ -0,0 +1,290 @@
+"""
+两个streamlit应用的并发会话压测
+
+基于streamlit.testing.v1.AppTest，在同一进程内模拟N个会话并发点击查询、导出和AI分析，
+ODPS、MySQL查询和大模型均替换为可配置延迟的替身，统计每次rerun的p50/p95/p99延迟、
+峰值内存(RSS)和吞吐。
+
+用法:
+    python LoadTest.py --app datacenter --sessions 20 --rounds 3
+    python LoadTest.py --app doubletail --sessions 50 --sql-latency 0.5
+"""
+import argparse
+import os
+import sys
+import tempfile
+import threading
+import time
+import types
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+APP_DIR = os.path.dirname(os.path.abspath(__file__))
+APPS = {
+    'datacenter': os.path.join(APP_DIR, 'DataCenterApp.py'),
+    'doubletail': os.path.join(APP_DIR, 'DoubleTailStocksApp.py'),
+}
+
+
+def make_lzt_data(stores=5, customers=200, days=30, seed=0):
+    """生成六滋堂会员日历的模拟数据"""
+    rng = np.random.default_rng(seed)
+    dates = pd.date_range('2025-01-01', periods=days).strftime('%Y%m%d')
+    store_names = [f"模拟门店{i}" for i in range(stores)]
+    n = stores * customers * days
+    store = np.repeat(store_names, customers * days)
+    customer = np.tile(np.repeat(np.arange(customers), days), stores)
+    return pd.DataFrame({
+        '门店': store,
+        '用户昵称': [f"用户{c}" for c in customer],
+        '用户手机号': [f"138{c:08d}" for c in customer],
+        '积分': rng.integers(0, 1000, n),
+        '添加的企微成员': [['顾问A'] for _ in range(n)],
+        '团长': '团长A',
+        '最后一次消费时间': '2025-01-01',
+        '历史累计消费': rng.random(n) * 3000,
+        '日期': np.tile(dates, stores * customers),
+        '周': np.tile([f"第{i // 7 + 1}周" for i in range(days)], stores * customers),
+        '看播时长': rng.random(n) * 60,
+        '领取积分': rng.integers(0, 10, n),
+        '金额': rng.random(n) * 100,
+        '累计看播时长': rng.random(n) * 600 + 1,
+        '累计领取积分': rng.integers(0, 100, n),
+        '累计金额': rng.random(n) * 1000,
+    })
+
+
+class _Column:
+    def __init__(self, name):
+        self.name = name
+
+
+class _Record:
+    def __init__(self, values):
+        self.values = values
+
+
+class _Reader:
+    def __init__(self, df, latency):
+        self._df = df
+        self._latency = latency
+        self.schema = types.SimpleNamespace(columns=[_Column(col) for col in df.columns])
+
+    def __iter__(self):
+        time.sleep(self._latency)
+        for row in self._df.itertuples(index=False):
+            yield _Record(list(row))
+
+
+class FakeOdps:
+    """ODPS替身：按SQL类型返回模拟数据，每次读取固定延迟"""
+
+    def __init__(self, data, latency):
+        self.data = data
+        self.latency = latency
+
+    def exist_project(self, name):
+        return True
+
+    def get_table(self, name):
+        columns = [types.SimpleNamespace(name=col, type='array<string>' if col == '添加的企微成员' else 'string')
+                   for col in self.data.columns]
+        return types.SimpleNamespace(table_schema=types.SimpleNamespace(simple_columns=columns))
+
+    def execute_sql(self, sql):
+        df = self.data
+        if 'dim_lzt_shop_df' in sql:
+            result = pd.DataFrame({'business_name': sorted(df['门店'].unique())})
+        elif 'MAX_PT' in sql and 'SELECT *' not in sql:
+            result = pd.DataFrame({'ds': ['20250131']})
+        elif 'GROUP BY 日期' in sql:
+            result = df.groupby('日期').agg(
+                cnt=('金额', 'size'), s1=('看播时长', 'sum'), s2=('领取积分', 'sum'), s3=('金额', 'sum'),
+                s4=('累计看播时长', 'sum'), s5=('累计领取积分', 'sum'), s6=('累计金额', 'sum')).reset_index()
+            result['h'] = 0
+        else:
+            result = df
+        return types.SimpleNamespace(open_reader=lambda **kwargs: _Reader(result, self.latency))
+
+
+class FakeOpenAI:
+    """大模型替身：首token延迟 + 按固定间隔流式返回"""
+
+    def __init__(self, first_token_latency, chunk_latency, chunks):
+        def create(model, messages, stream=True):
+            def generate():
+                time.sleep(first_token_latency)
+                for i in range(chunks):
+                    time.sleep(chunk_latency)
+                    delta = types.SimpleNamespace(content=f"模拟分析内容{i}。")
+                    finish_reason = 'stop' if i == chunks - 1 else None
+                    yield types.SimpleNamespace(choices=[types.SimpleNamespace(delta=delta, finish_reason=finish_reason)])
+            return generate()
+        self.chat = types.SimpleNamespace(completions=types.SimpleNamespace(create=create))
+
+
+def install_backends(args):
+    """用替身替换ODPS、OpenAI模块和MySQL查询函数"""
+    data = make_lzt_data(stores=args.stores, customers=args.customers)
+    odps = types.ModuleType('odps')
+    odps.ODPS = lambda *a, **kw: FakeOdps(data, args.odps_latency)
+    sys.modules['odps'] = odps
+
+    openai = types.ModuleType('openai')
+    openai.OpenAI = lambda **kw: FakeOpenAI(args.llm_latency, args.llm_chunk_latency, args.llm_chunks)
+    sys.modules['openai'] = openai
+
+    import TushareData
+    rng = np.random.default_rng(1)
+
+    def fake_double_tail(days=6, db_path=None):
+        time.sleep(args.sql_latency)
+        n = args.result_rows
+        return pd.DataFrame({'name': [f"股票{i}" for i in range(n)],
+                             'ts_code': [f"{i:06d}.SZ" for i in range(n)],
+                             'low': (rng.integers(1, 50, n) * 100 + 33) / 100})
+    TushareData.query_stocks_with_double_tail_number = fake_double_tail
+
+
+SECRETS = {
+    'odps': {'access_key_id': 'x', 'access_key_secret': 'x', 'project': 'x', 'endpoint': 'x'},
+    'openai': {'api_key': 'x', 'base_url': 'x', 'model': 'load-test'},
+    'mysql': {'host': 'x', 'user': 'x', 'password': 'x', 'database': 'x'},
+    'tushare': {'token': 'x'},
+}
+
+
+def prepare_shared_runtime():
+    """
+    AppTest每次run都会替换再清空进程全局的Runtime实例和st.secrets，多个会话并发时会互相覆盖。
+    这里改为所有会话共享一个模拟Runtime（媒体文件、缓存与真实服务一样在会话间共享），
+    并全局设置secrets，AppTest自身不再传入secrets。
+    """
+    from unittest.mock import MagicMock
+    import streamlit as st
+    from streamlit.runtime import Runtime
+    from streamlit.runtime.caching.storage.dummy_cache_storage import MemoryCacheStorageManager
+    from streamlit.runtime.media_file_manager import MediaFileManager
+    from streamlit.runtime.memory_media_file_storage import MemoryMediaFileStorage
+    from streamlit.runtime.secrets import Secrets
+    import streamlit.testing.v1.app_test as app_test_module
+
+    shared_runtime = MagicMock(spec=Runtime)
+    shared_runtime.media_file_mgr = MediaFileManager(MemoryMediaFileStorage("/mock/media"))
+    shared_runtime.cache_storage_manager = MemoryCacheStorageManager()
+    Runtime._instance = shared_runtime
+    # AppTest对Runtime._instance的赋值落到这个占位对象上，不影响共享实例
+    app_test_module.Runtime = types.SimpleNamespace(_instance=None)
+
+    secrets = Secrets()
+    secrets._secrets = SECRETS
+    st.secrets = secrets
+
+
+def _click(at, label):
+    for button in list(at.sidebar.button) + list(at.button):
+        if button.label == label:
+            return button.click()
+    raise LookupError(f"找不到按钮: {label}")
+
+
+FLOWS = {
+    'datacenter': ['获取最新数据', '完全导出数据', '批量导出全部门店', '开始AI分析'],
+    'doubletail': ['🔍 查询数据', '📊 生成Excel格式'],
+}
+
+
+def run_session(app, rounds, timeout, latencies, errors):
+    """单个会话：打开页面后按流程依次点击，记录每次rerun耗时"""
+    from streamlit.testing.v1 import AppTest
+    at = AppTest.from_file(APPS[app], default_timeout=timeout)
+    steps = [None] + FLOWS[app] * rounds
+    for label in steps:
+        start = time.perf_counter()
+        try:
+            if label is None:
+                at.run()
+            else:
+                _click(at, label).run()
+            if at.exception:
+                errors.append(f"{label}: {at.exception[0].message}")
+        except Exception as e:
+            errors.append(f"{label}: {e}")
+        latencies.append((label or '打开页面', (time.perf_counter() - start) * 1000))
+
+
+def _peak_rss_mb():
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux单位为KB，macOS为字节
+    return peak / 1024 / (1024 if sys.platform == 'darwin' else 1)
+
+
+def report(latencies, errors, wall_time, sessions):
+    df = pd.DataFrame(latencies, columns=['step', 'ms'])
+    summary = df.groupby('step', sort=False)['ms'].describe(percentiles=[0.5, 0.95, 0.99])
+    summary = summary[['count', '50%', '95%', '99%', 'max']].round(1)
+    summary.loc['全部'] = [len(df)] + list(np.percentile(df['ms'], [50, 95, 99]).round(1)) + [round(df['ms'].max(), 1)]
+    print(summary.rename(columns={'50%': 'p50', '95%': 'p95', '99%': 'p99'}).to_string())
+    print(f"\n会话数: {sessions}，总rerun: {len(df)}，耗时: {wall_time:.1f}s，吞吐: {len(df) / wall_time:.2f} rerun/s")
+    peak = _peak_rss_mb()
+    if peak is not None:
+        print(f"峰值RSS: {peak:.0f} MB")
+    if errors:
+        print(f"\n错误 {len(errors)} 个，前5个:")
+        for error in errors[:5]:
+            print(f"  {error}")
+    return summary
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="streamlit应用并发压测")
+    parser.add_argument('--app', choices=list(APPS), default='datacenter')
+    parser.add_argument('--sessions', type=int, default=10, help="并发会话数")
+    parser.add_argument('--rounds', type=int, default=1, help="每个会话重复点击流程的轮数")
+    parser.add_argument('--timeout', type=float, default=120, help="单次rerun超时(秒)")
+    parser.add_argument('--odps-latency', type=float, default=0.2, help="ODPS每次读取延迟(秒)")
+    parser.add_argument('--sql-latency', type=float, default=0.2, help="MySQL查询延迟(秒)")
+    parser.add_argument('--llm-latency', type=float, default=1.0, help="大模型首token延迟(秒)")
+    parser.add_argument('--llm-chunk-latency', type=float, default=0.02)
+    parser.add_argument('--llm-chunks', type=int, default=100)
+    parser.add_argument('--stores', type=int, default=5)
+    parser.add_argument('--customers', type=int, default=200)
+    parser.add_argument('--result-rows', type=int, default=500, help="双尾数查询返回行数")
+    args = parser.parse_args(argv)
+
+    # 本地缓存写到临时目录，不影响正式数据；应用导出时写的本地文件也落在临时目录
+    work_dir = tempfile.mkdtemp(prefix='datacenter_load_')
+    os.environ['DATACENTER_DATA_DIR'] = work_dir
+    os.chdir(work_dir)
+    sys.path.insert(0, APP_DIR)
+    install_backends(args)
+    prepare_shared_runtime()
+
+    latencies, errors = [], []
+    lock = threading.Lock()
+
+    def session():
+        local_latencies, local_errors = [], []
+        run_session(args.app, args.rounds, args.timeout, local_latencies, local_errors)
+        with lock:
+            latencies.extend(local_latencies)
+            errors.extend(local_errors)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.sessions) as executor:
+        for future in [executor.submit(session) for _ in range(args.sessions)]:
+            future.result()
+    wall_time = time.perf_counter() - start
+    print(f"工作目录: {work_dir}")
+    report(latencies, errors, wall_time, args.sessions)
+    return 1 if errors else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,209 @@
+import json
+import os
+import threading
+
+import pandas as pd
+
+from IngestConfig import LOCAL_DATA_DIR
+from PerfPanel import timed
+
+# 六滋堂会员日历（滚动30天快照）的本地物化副本
+# 每次同步只比较前后两个 ds 分区中每个「日期」的摘要，仅拉取新增或变化的日期，
+# 并删除已滑出窗口的日期；预览和导出均直接读取本地副本，不再走全量Tunnel下载。
+# 每个日期文件名带 ds，同步只写新文件、替换 meta.json 后才删除被取代的旧文件，
+# 读取方按读到的 meta.json 读取一份一致的快照，不会读到同步到一半的数据。
+TABLE_NAME = 'yswy_ads.ads_lzt_customer_analysis_30_df'
+LOCAL_DIR = os.path.join(LOCAL_DATA_DIR, 'lzt_customer_analysis_30')
+META_FILE = 'meta.json'
+
+# 导出时的分组字段，与原 query_sql 中的 GROUP BY 保持一致
+GROUP_COLUMNS = ['门店', '用户昵称', '用户手机号', '积分', '添加的企微成员', '团长', '最后一次消费时间',
+                 '历史累计消费', '日期', '周', '累计看播时长', '累计领取积分', '累计金额']
+EXPORT_COLUMNS = ['门店', '用户昵称', '用户手机号', '积分', '添加的企微成员', '团长', '最后一次消费时间',
+                  '历史累计消费', '日期', '周', '看播时长', '领取积分', '下单金额',
+                  '累计看播时长', '累计领取积分', '累计金额']
+
+# 读取期间旧文件被同步删除时，按新的元数据重读的次数
+SNAPSHOT_RETRIES = 3
+
+_sync_lock = threading.Lock()
+
+
+@timed("ODPS Tunnel读取", rows=len)
+def _read_sql(o, sql):
+    """执行SQL并以DataFrame返回结果"""
+    reader = o.execute_sql(sql).open_reader(tunnel=True, limit=False)
+    data = []
+    for record in reader:
+        data.append(record.values)
+    columns = [col.name for col in reader.schema.columns]
+    return pd.DataFrame(data, columns=columns)
+
+
+def _load_meta(local_dir):
+    path = os.path.join(local_dir, META_FILE)
+    if not os.path.exists(path):
+        return {'ds': None, 'dates': {}}
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def _save_meta(local_dir, meta):
+    # 先写临时文件再替换，避免同步中断时留下损坏的元数据
+    path = os.path.join(local_dir, META_FILE)
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(meta, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, path)
+
+
+def _date_file(date, ds):
+    return '_'.join(['date', ''.join(c if c.isalnum() else '_' for c in f"{date}_{ds}")]) + '.pkl'
+
+
+def get_latest_ds(o):
+    """获取源表最新分区"""
+    df = _read_sql(o, f"SELECT MAX_PT('{TABLE_NAME}') AS ds")
+    return str(df.iloc[0, 0])
+
+
+def _row_hash_sql(o):
+    """
+    整行摘要表达式：全部非分区列转为字符串拼接后取MD5前8位（32位整数），
+    按日期求和即可发现任意列（含团长、最后一次消费时间等客户属性）的变化
+    """
+    table = o.get_table(TABLE_NAME)
+    schema = getattr(table, 'table_schema', None) or table.schema
+    parts = []
+    for column in schema.simple_columns:
+        if str(column.type).lower().startswith('array'):
+            value = f"CONCAT_WS(',', `{column.name}`)"
+        else:
+            value = f"CAST(`{column.name}` AS STRING)"
+        # CONCAT_WS 遇到NULL参数返回NULL，先替换为占位符
+        parts.append(f"COALESCE({value}, '<null>')")
+    return f"SUM(CAST(CONV(SUBSTR(MD5(CONCAT_WS('|', {', '.join(parts)})), 1, 8), 16, 10) AS BIGINT))"
+
+
+def get_date_signatures(o, ds):
+    """
+    计算指定分区中每个日期的摘要（行数、各度量列之和及整行哈希之和）
+    摘要不同即认为该日期的数据发生了变化
+    """
+    df = _read_sql(o, f"""
+        SELECT  日期, COUNT(*) AS cnt, SUM(看播时长) AS s1, SUM(领取积分) AS s2, SUM(金额) AS s3,
+                SUM(累计看播时长) AS s4, SUM(累计领取积分) AS s5, SUM(累计金额) AS s6,
+                {_row_hash_sql(o)} AS h
+        FROM    {TABLE_NAME}
+        WHERE   ds = '{ds}'
+        GROUP BY 日期
+    """)
+    signatures = {}
+    for row in df.itertuples(index=False):
+        signatures[str(row[0])] = [str(v) for v in row[1:]]
+    return signatures
+
+
+def sync_local_dataset(o, local_dir=LOCAL_DIR):
+    """
+    将本地副本同步到源表最新分区
+
+    返回:
+    同步摘要字典：ds、新增/变化的日期、删除的日期
+    """
+    with _sync_lock:
+        os.makedirs(local_dir, exist_ok=True)
+        meta = _load_meta(local_dir)
+        ds = get_latest_ds(o)
+        if meta['ds'] == ds:
+            return {'ds': ds, 'changed': [], 'removed': [], 'cached': True}
+
+        signatures = get_date_signatures(o, ds)
+        local_dates = meta['dates']
+
+        changed = [d for d, sig in signatures.items()
+                   if d not in local_dates or local_dates[d]['sig'] != sig]
+        removed = [d for d in local_dates if d not in signatures]
+
+        # 被取代的旧文件在新的元数据生效后才删除，正在读取旧快照的会话不受影响
+        superseded = [local_dates[d]['file'] for d in changed if d in local_dates]
+        if changed:
+            date_list = ','.join(f"'{d}'" for d in changed)
+            df = _read_sql(o, f"SELECT * FROM {TABLE_NAME} WHERE ds = '{ds}' AND 日期 IN ({date_list})")
+            df['日期'] = df['日期'].astype(str)
+            for date in changed:
+                file_name = _date_file(date, ds)
+                df[df['日期'] == date].reset_index(drop=True).to_pickle(os.path.join(local_dir, file_name))
+                local_dates[date] = {'sig': signatures[date], 'file': file_name}
+
+        for date in removed:
+            superseded.append(local_dates.pop(date)['file'])
+
+        meta['ds'] = ds
+        _save_meta(local_dir, meta)
+        for file_name in superseded:
+            file_path = os.path.join(local_dir, file_name)
+            if os.path.exists(file_path):
+                os.remove(file_path)
+        print(f"本地数据已同步到分区 {ds}：更新 {len(changed)} 天，删除 {len(removed)} 天")
+        return {'ds': ds, 'changed': changed, 'removed': removed, 'cached': False}
+
+
+def get_local_ds(local_dir=LOCAL_DIR):
+    """本地副本当前对应的源表分区，尚未同步时返回None"""
+    return _load_meta(local_dir)['ds']
+
+
+def load_local_dataset(shop=None, local_dir=LOCAL_DIR, ds=None):
+    """
+    读取本地副本，结果是某一个 ds 分区的完整快照
+    shop: 门店名称，为None或"全部门店"时返回全部门店
+    ds: 指定时只读取该分区的快照，本地副本已同步到其他分区时抛出异常
+    """
+    for _ in range(SNAPSHOT_RETRIES):
+        meta = _load_meta(local_dir)
+        if ds is not None and meta['ds'] != ds:
+            raise RuntimeError(f"本地副本已同步到分区 {meta['ds']}，不再是 {ds}")
+        frames = []
+        try:
+            for date in sorted(meta['dates']):
+                df = pd.read_pickle(os.path.join(local_dir, meta['dates'][date]['file']))
+                if shop and shop != "全部门店":
+                    df = df[df['门店'] == shop]
+                frames.append(df)
+        except FileNotFoundError:
+            # 读取期间同步完成并删除了旧快照的文件，按新的元数据重读
+            continue
+        if not frames:
+            return pd.DataFrame()
+        return pd.concat(frames, ignore_index=True)
+    raise RuntimeError("本地副本正在频繁同步，读取失败，请稍后重试")
+
+
+def _concat_members(value):
+    # 等价于 CONCAT_WS(',', 添加的企微成员)
+    if value is None:
+        return None
+    if isinstance(value, (list, tuple)):
+        return ','.join(str(v) for v in value if v is not None)
+    return str(value)
+
+
+def build_export_data(df):
+    """
+    在本地完成与原导出SQL相同的过滤和聚合
+    """
+    if df.empty:
+        return pd.DataFrame(columns=EXPORT_COLUMNS)
+    # 与SQL的 <> 0 一致：NULL不满足条件，需要一并过滤
+    df = df[df['累计看播时长'].notna() & (df['累计看播时长'] != 0)].copy()
+    df['添加的企微成员'] = df['添加的企微成员'].map(_concat_members)
+    result = df.groupby(GROUP_COLUMNS, dropna=False, sort=False).agg(
+        看播时长=('看播时长', 'sum'),
+        领取积分=('领取积分', 'sum'),
+        下单金额=('金额', 'sum')
+    ).reset_index()
+    result['看播时长'] = result['看播时长'].astype(float).round(0)
+    result['领取积分'] = result['领取积分'].astype(float).round(0)
+    result['下单金额'] = result['下单金额'].astype(float).round(1)
+    return result[EXPORT_COLUMNS]
@@ -0,0 +1,175 @@
+"""
+stock_daily 在线迁移到紧凑结构（见 TushareData.stock_daily_ddl）
+
+旧结构: 自增id主键、VARCHAR(20)交易日、DECIMAL(10,3)价格，以及冗余的
+idx_ts_code_date（与唯一键重复）和无查询使用的 idx_low_price。
+
+步骤:
+1. 按旧表的最早月份建新表 <table>_new（已存在则继续上次的进度）
+2. 按交易日逐日 INSERT ... SELECT 复制（严格sql_mode，超出新列范围的值直接报错；
+   已复制的行按主键排除），每批只锁一个交易日的数据，采集可照常写入旧表
+3. 比对每个交易日的行数，重新复制不一致的交易日（迁移期间新写入的数据）
+4. 逐日比对行数和各数值列的合计，有差异（如价格超过两位小数被舍入）则不切换
+5. RENAME TABLE 原子切换，切换后再比对一次，补齐切换前最后时刻写入旧表的数据
+旧表保留为 <table>_old，确认无误后可用 --drop-old 删除。
+"""
+import time
+
+from DailyTiering import DAILY_COLUMNS
+from TushareData import get_db_connection, stock_daily_ddl, format_trade_date
+
+
+# 截断、越界、非法日期直接报错，而不是警告后写入
+STRICT_SQL_MODE = 'STRICT_ALL_TABLES,NO_ZERO_IN_DATE,NO_ZERO_DATE,ERROR_FOR_DIVISION_BY_ZERO,NO_ENGINE_SUBSTITUTION'
+# 参与逐日核对的数值列
+CHECKSUM_COLUMNS = [col for col in DAILY_COLUMNS if col not in ('ts_code', 'trade_date')]
+
+
+def _connect():
+    conn = get_db_connection(charset='utf8mb4', autocommit=True, connect_timeout=60,
+                             read_timeout=3600, write_timeout=3600)
+    cursor = conn.cursor()
+    cursor.execute("SET SESSION sql_mode = %s", (STRICT_SQL_MODE,))
+    cursor.close()
+    return conn
+
+
+def _table_exists(cursor, table):
+    cursor.execute("SHOW TABLES LIKE %s", (table,))
+    return cursor.fetchone() is not None
+
+
+def is_compact(cursor, table):
+    """trade_date已是DATE类型即视为已迁移"""
+    cursor.execute('''
+        SELECT DATA_TYPE FROM information_schema.COLUMNS
+        WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s AND COLUMN_NAME = 'trade_date'
+    ''', (table,))
+    row = cursor.fetchone()
+    return row is not None and row[0].lower() == 'date'
+
+
+def _date_counts(cursor, table):
+    cursor.execute(f"SELECT trade_date, COUNT(*) FROM {table} GROUP BY trade_date")
+    return {format_trade_date(date): count for date, count in cursor.fetchall()}
+
+
+def _copy_date(cursor, source, target, trade_date):
+    # 不用INSERT IGNORE：它会把越界、截断的值降级为警告后照常写入；已复制的行显式排除
+    columns = ','.join(f"`{col}`" for col in DAILY_COLUMNS)
+    source_columns = ','.join(f"s.`{col}`" for col in DAILY_COLUMNS)
+    cursor.execute(f'''
+        INSERT INTO {target} ({columns})
+        SELECT {source_columns} FROM {source} s
+        LEFT JOIN {target} t ON t.ts_code = s.ts_code AND t.trade_date = s.trade_date
+        WHERE s.trade_date = %s AND t.ts_code IS NULL
+    ''', (trade_date,))
+
+
+def _date_checksums(cursor, table):
+    sums = ','.join(f"SUM(`{col}`)" for col in CHECKSUM_COLUMNS)
+    cursor.execute(f"SELECT trade_date, COUNT(*), {sums} FROM {table} GROUP BY trade_date")
+    return {format_trade_date(row[0]): tuple(row[1:]) for row in cursor.fetchall()}
+
+
+def verify_dates(cursor, source, target):
+    """
+    逐日比对行数和数值列合计（DECIMAL合计是精确值，舍入或截断都会体现为差异）
+
+    返回:
+    不一致的交易日列表
+    """
+    source_sums = _date_checksums(cursor, source)
+    target_sums = _date_checksums(cursor, target)
+    return sorted(d for d in set(source_sums) | set(target_sums) if source_sums.get(d) != target_sums.get(d))
+
+
+def sync_dates(cursor, source, target, pause=0.0):
+    """
+    按交易日比对行数，复制目标表缺失或行数不足的交易日
+
+    返回:
+    复制的交易日数
+    """
+    source_counts = _date_counts(cursor, source)
+    target_counts = _date_counts(cursor, target)
+    dates = sorted(d for d, count in source_counts.items() if target_counts.get(d, 0) < count)
+    for i, trade_date in enumerate(dates):
+        _copy_date(cursor, source, target, trade_date)
+        if (i + 1) % 20 == 0 or i + 1 == len(dates):
+            print(f"已复制 {i + 1}/{len(dates)} 个交易日，当前 {trade_date}")
+        # 批次间短暂停顿，减轻对线上读写的影响
+        if pause:
+            time.sleep(pause)
+    return len(dates)
+
+
+def migrate_stock_daily(table='stock_daily', drop_old=False, pause=0.0, max_passes=5):
+    """
+    在线迁移table到紧凑结构
+
+    返回:
+    是否完成切换
+    """
+    new_table = f"{table}_new"
+    old_table = f"{table}_old"
+    try:
+        conn = _connect()
+        cursor = conn.cursor()
+        if is_compact(cursor, table):
+            print(f"{table} 已是紧凑结构，无需迁移")
+            if drop_old and _table_exists(cursor, old_table):
+                cursor.execute(f"DROP TABLE {old_table}")
+                print(f"已删除 {old_table}")
+            cursor.close()
+            conn.close()
+            return True
+        if _table_exists(cursor, old_table):
+            print(f"{old_table} 已存在，请确认上次迁移的结果后再执行")
+            cursor.close()
+            conn.close()
+            return False
+
+        cursor.execute(f"SELECT MIN(trade_date) FROM {table}")
+        first_date = format_trade_date(cursor.fetchone()[0])
+        first_month = first_date[:6] if first_date else None
+        # 归档表保持行压缩
+        row_format = 'COMPRESSED' if table.endswith('_archive') else None
+        cursor.execute(stock_daily_ddl(new_table, first_month=first_month, row_format=row_format))
+
+        # 反复比对直到没有需要复制的交易日（采集仍在写入旧表）
+        for attempt in range(max_passes):
+            copied = sync_dates(cursor, table, new_table, pause)
+            print(f"第 {attempt + 1} 轮比对复制 {copied} 个交易日")
+            if copied == 0:
+                break
+
+        mismatched = verify_dates(cursor, table, new_table)
+        if mismatched:
+            print(f"{len(mismatched)} 个交易日核对不一致，未切换（{new_table} 保留待检查）: "
+                  f"{', '.join(mismatched[:20])}")
+            cursor.close()
+            conn.close()
+            return False
+
+        cursor.execute(f"RENAME TABLE {table} TO {old_table}, {new_table} TO {table}")
+        print(f"已切换: {table} -> {old_table}, {new_table} -> {table}")
+        # 切换前最后时刻写入旧表的数据
+        copied = sync_dates(cursor, old_table, table)
+        if copied:
+            print(f"切换后补齐 {copied} 个交易日")
+        mismatched = verify_dates(cursor, old_table, table)
+        if mismatched:
+            print(f"切换后 {len(mismatched)} 个交易日核对不一致，请检查后再删除 {old_table}: "
+                  f"{', '.join(mismatched[:20])}")
+            drop_old = False
+
+        if drop_old:
+            cursor.execute(f"DROP TABLE {old_table}")
+            print(f"已删除 {old_table}")
+        cursor.close()
+        conn.close()
+        return True
+    except Exception as e:
+        print(f"迁移 {table} 时出错: {e}")
+        return False
@@ -0,0 +1,120 @@
+"""
+轻量性能埋点：按阶段记录耗时和行数，每次脚本执行（rerun）汇总一次
+
+用法:
+    begin_rerun("DataCenterApp")
+    with stage("SQL查询") as rec:
+        df = ...
+        rec['rows'] = len(df)
+    end_rerun(show=True)
+
+记录保存在当前线程中（streamlit每个会话在各自的线程中执行脚本），未调用begin_rerun时埋点不做任何事。
+每次rerun的结果追加到 local_data/perf_log.jsonl，便于分析趋势。
+"""
+import functools
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+
+from IngestConfig import LOCAL_DATA_DIR
+
+PERF_LOG = os.path.join(LOCAL_DATA_DIR, 'perf_log.jsonl')
+
+_local = threading.local()
+# 进程级统计：模块只导入一次，首次rerun即冷启动
+_process_stats = {}
+_log_lock = threading.Lock()
+
+
+def begin_rerun(app, started_at=None):
+    """开始一次rerun的记录，started_at为脚本开始执行的perf_counter时间"""
+    _local.rerun = {'app': app, 'start': started_at or time.perf_counter(), 'stages': []}
+
+
+@contextmanager
+def stage(name, rows=None):
+    """记录一个阶段的耗时，可在with块中设置rec['rows']"""
+    rerun = getattr(_local, 'rerun', None)
+    rec = {'stage': name, 'rows': rows}
+    start = time.perf_counter()
+    try:
+        yield rec
+    finally:
+        rec['ms'] = round((time.perf_counter() - start) * 1000, 1)
+        if rerun is not None:
+            rerun['stages'].append(rec)
+
+
+def add_stage(name, ms, rows=None):
+    """直接记录一个已知耗时的阶段，如脚本开头的模块导入"""
+    rerun = getattr(_local, 'rerun', None)
+    if rerun is not None:
+        rerun['stages'].append({'stage': name, 'rows': rows, 'ms': round(ms, 1)})
+
+
+def timed(name, rows=None):
+    """
+    装饰器版本的stage
+    rows: 可选函数，根据返回值计算行数，如 rows=len
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with stage(name) as rec:
+                result = func(*args, **kwargs)
+                if rows is not None and result is not None:
+                    rec['rows'] = rows(result)
+                return result
+        return wrapper
+    return decorator
+
+
+def _append_log(record, log_path):
+    with _log_lock:
+        os.makedirs(os.path.dirname(log_path), exist_ok=True)
+        with open(log_path, 'a', encoding='utf-8') as f:
+            f.write(json.dumps(record, ensure_ascii=False) + '\n')
+
+
+def end_rerun(show=False, log_path=PERF_LOG):
+    """
+    结束本次rerun的记录：写入日志，show为True时在侧边栏显示性能面板
+
+    返回:
+    本次rerun的记录，未调用begin_rerun时返回None
+    """
+    rerun = getattr(_local, 'rerun', None)
+    if rerun is None:
+        return None
+    _local.rerun = None
+    total_ms = round((time.perf_counter() - rerun['start']) * 1000, 1)
+    stats = _process_stats.setdefault(rerun['app'], {'cold_start_ms': total_ms, 'reruns': []})
+    stats['reruns'] = (stats['reruns'] + [total_ms])[-50:]
+
+    record = {'time': datetime.now().strftime('%Y-%m-%d %H:%M:%S'), 'app': rerun['app'],
+              'total_ms': total_ms, 'stages': rerun['stages']}
+    try:
+        _append_log(record, log_path)
+    except OSError as e:
+        print(f"写入性能日志失败: {e}")
+
+    if show:
+        _render(record, stats)
+    return record
+
+
+def _render(record, stats):
+    import pandas as pd
+    import streamlit as st
+    with st.sidebar.expander("性能面板", expanded=True):
+        st.write(f"本次执行: {record['total_ms']:.0f} ms，冷启动: {stats['cold_start_ms']:.0f} ms")
+        reruns = stats['reruns']
+        st.write(f"近{len(reruns)}次平均: {sum(reruns) / len(reruns):.0f} ms")
+        if record['stages']:
+            st.dataframe(pd.DataFrame(record['stages'])[['stage', 'ms', 'rows']],
+                         hide_index=True, use_container_width=True)
+        else:
+            st.caption("本次执行没有记录到阶段耗时")
@@ -0,0 +1,222 @@
+"""
+内存映射的共享价格面板
+
+每个交易日构建一次：股票 × 交易日 的 int32 价格矩阵（单位：分，0表示当日无数据），
+以 .npy 文件保存，所有进程以只读 mmap 方式打开，操作系统页缓存在进程间共享，
+内存占用与用户数无关。
+
+面板按 (交易日, 该日行数) 命名：当日采集仍在写入时构建的面板，行数变化后会重建。
+"""
+import glob
+import json
+import os
+import shutil
+import threading
+
+import numpy as np
+import pandas as pd
+
+from IngestConfig import LOCAL_DATA_DIR
+
+PANEL_DIR = os.path.join(LOCAL_DATA_DIR, 'price_panel')
+PRICE_FIELDS = ['open', 'high', 'low', 'close']
+DEFAULT_HISTORY_DAYS = 250
+DOUBLE_TAIL_CENTS = [11, 22, 33, 44, 55, 66, 77, 88, 99]
+
+_panels = {}
+_panels_lock = threading.Lock()
+
+
+def _panel_path(trade_date, rows, panel_dir=PANEL_DIR):
+    return os.path.join(panel_dir, f"{trade_date}-{rows}")
+
+
+def get_latest_trade_date():
+    """数据库中最新的交易日"""
+    from TushareData import get_db_connection, format_trade_date
+    conn = get_db_connection(charset='utf8mb4', autocommit=True)
+    try:
+        cursor = conn.cursor()
+        cursor.execute("SELECT MAX(trade_date) FROM stock_daily")
+        trade_date = format_trade_date(cursor.fetchone()[0])
+        cursor.close()
+        return trade_date
+    finally:
+        conn.close()
+
+
+def get_trade_date_rows(trade_date):
+    """交易日在stock_daily中的行数"""
+    from TushareData import get_db_connection
+    conn = get_db_connection(charset='utf8mb4', autocommit=True)
+    try:
+        cursor = conn.cursor()
+        cursor.execute("SELECT COUNT(*) FROM stock_daily WHERE trade_date = %s", (trade_date,))
+        rows = cursor.fetchone()[0]
+        cursor.close()
+        return rows
+    finally:
+        conn.close()
+
+
+def get_latest_panel_key():
+    """
+    最新交易日及其行数，作为面板的缓存键
+
+    返回:
+    (trade_date, rows)，表为空时返回 (None, 0)
+    """
+    trade_date = get_latest_trade_date()
+    if trade_date is None:
+        return None, 0
+    return trade_date, get_trade_date_rows(trade_date)
+
+
+def _panel_index(trade_date, history_days):
+    """面板的交易日(YYYYMMDD)、股票代码和名称"""
+    from TushareData import get_db_connection, format_trade_date
+    conn = get_db_connection(charset='utf8mb4', autocommit=True, read_timeout=600)
+    try:
+        cursor = conn.cursor()
+        cursor.execute('''
+            SELECT DISTINCT trade_date FROM stock_daily
+            WHERE trade_date <= %s ORDER BY trade_date DESC LIMIT %s
+        ''', (trade_date, history_days))
+        dates = sorted(format_trade_date(row[0]) for row in cursor.fetchall())
+        if not dates:
+            cursor.close()
+            return [], [], {}
+        cursor.execute("SELECT DISTINCT ts_code FROM stock_daily WHERE trade_date BETWEEN %s AND %s",
+                       (dates[0], dates[-1]))
+        ts_codes = sorted(row[0] for row in cursor.fetchall())
+        cursor.execute("SELECT ts_code, name FROM stock_basic")
+        names = dict(cursor.fetchall())
+        cursor.close()
+        return dates, ts_codes, names
+    finally:
+        conn.close()
+
+
+def _iter_history(dates):
+    from TushareData import iter_query_chunks
+    return iter_query_chunks(
+        "SELECT ts_code, trade_date, open, high, low, close FROM stock_daily WHERE trade_date BETWEEN %s AND %s",
+        (dates[0], dates[-1]), chunksize=200000)
+
+
+def build_panel(trade_date, history_days=DEFAULT_HISTORY_DAYS, panel_dir=PANEL_DIR, rows=None):
+    """
+    构建截至trade_date的价格面板，同一交易日、同样行数的面板已存在时直接返回路径
+    rows: trade_date当日的行数，默认查询数据库
+
+    返回:
+    面板目录，没有数据时返回None
+    """
+    if rows is None:
+        rows = get_trade_date_rows(trade_date)
+    path = _panel_path(trade_date, rows, panel_dir)
+    if os.path.exists(path):
+        return path
+
+    dates, ts_codes, names = _panel_index(trade_date, history_days)
+    if not dates:
+        print(f"{trade_date} 及之前没有日线数据，无法构建价格面板")
+        return None
+    code_index = pd.Index(ts_codes)
+    date_index = pd.Index(dates)
+    matrices = {field: np.zeros((len(ts_codes), len(dates)), dtype=np.int32) for field in PRICE_FIELDS}
+    # 流式读取，逐块写入预分配的矩阵，不在内存中保留完整的查询结果
+    for chunk in _iter_history(dates):
+        row_index = code_index.get_indexer(chunk['ts_code'])
+        col_index = date_index.get_indexer(chunk['trade_date'])
+        for field in PRICE_FIELDS:
+            cents = np.rint(chunk[field].fillna(0).to_numpy(dtype=np.float64) * 100)
+            matrices[field][row_index, col_index] = cents.astype(np.int32)
+
+    # 先写到临时目录再整体改名，其他进程不会读到写了一半的面板
+    tmp_path = f"{path}.tmp{os.getpid()}"
+    os.makedirs(tmp_path, exist_ok=True)
+    for field, matrix in matrices.items():
+        np.save(os.path.join(tmp_path, f"{field}.npy"), matrix)
+    with open(os.path.join(tmp_path, 'index.json'), 'w', encoding='utf-8') as f:
+        json.dump({'ts_codes': ts_codes, 'dates': dates,
+                   'names': [names.get(code) for code in ts_codes]}, f, ensure_ascii=False)
+    try:
+        os.rename(tmp_path, path)
+    except OSError:
+        # 其他进程已先完成构建
+        shutil.rmtree(tmp_path, ignore_errors=True)
+    # 删除同一交易日数据不完整时构建的旧面板（已打开的mmap不受影响）
+    for stale in glob.glob(os.path.join(panel_dir, f"{trade_date}-*")):
+        if stale != path and '.tmp' not in os.path.basename(stale):
+            shutil.rmtree(stale, ignore_errors=True)
+    print(f"价格面板已构建: {trade_date}，{len(ts_codes)} 只股票 × {len(dates)} 个交易日")
+    return path
+
+
+class PricePanel:
+    """只读价格面板，数组为内存映射，多进程零拷贝共享"""
+
+    def __init__(self, path):
+        self.path = path
+        with open(os.path.join(path, 'index.json'), 'r', encoding='utf-8') as f:
+            index = json.load(f)
+        self.ts_codes = index['ts_codes']
+        self.dates = index['dates']
+        self.names = index['names']
+        self.code_index = {code: i for i, code in enumerate(self.ts_codes)}
+        self.date_index = {date: i for i, date in enumerate(self.dates)}
+        self.arrays = {field: np.load(os.path.join(path, f"{field}.npy"), mmap_mode='r')
+                       for field in PRICE_FIELDS}
+
+    def __getitem__(self, field):
+        return self.arrays[field]
+
+    def history(self, ts_code, field='close'):
+        """单只股票的价格序列（元），无数据的交易日为NaN"""
+        row = self.arrays[field][self.code_index[ts_code]]
+        return pd.Series(np.where(row > 0, row / 100, np.nan), index=self.dates, name=ts_code)
+
+
+def open_panel(trade_date=None, history_days=DEFAULT_HISTORY_DAYS, panel_dir=PANEL_DIR, rows=None):
+    """
+    打开（必要时先构建）指定交易日的面板，进程内按路径缓存
+
+    返回:
+    PricePanel，没有数据时返回None
+    """
+    trade_date = trade_date or get_latest_trade_date()
+    if trade_date is None:
+        return None
+    path = build_panel(trade_date, history_days, panel_dir, rows=rows)
+    if path is None:
+        return None
+    with _panels_lock:
+        # 同一交易日只保留最新的面板
+        prefix = os.path.join(panel_dir, f"{trade_date}-")
+        for cached in [p for p in _panels if p.startswith(prefix) and p != path]:
+            del _panels[cached]
+        if path not in _panels:
+            _panels[path] = PricePanel(path)
+        return _panels[path]
+
+
+def query_double_tail_from_panel(panel, days=6):
+    """
+    在价格面板上执行与 query_stocks_with_double_tail_number 相同的筛选
+
+    返回:
+    DataFrame(name, ts_code, low)
+    """
+    low = panel['low'][:, -max(days, 3):]
+    # 无数据记为int32最大值，不影响取最小值
+    masked = np.where(low > 0, low, np.iinfo(np.int32).max)
+    min_n = masked[:, -days:].min(axis=1)
+    min_3 = masked[:, -3:].min(axis=1)
+    hit = (min_n == min_3) & (min_n < np.iinfo(np.int32).max) & np.isin(min_n % 100, DOUBLE_TAIL_CENTS)
+    rows = np.nonzero(hit)[0]
+    return pd.DataFrame({
+        'name': [panel.names[i] for i in rows],
+        'ts_code': [panel.ts_codes[i] for i in rows],
+        'low': min_n[rows] / 100,
+    })
@@ -1,19 +1,26 @@
 import tushare as ts
 import pandas as pd
 import pymysql
+import pymysql.cursors
+from pymysql.constants import FIELD_TYPE
 from datetime import datetime, timedelta
 import time
-import streamlit as st
-from streamlit.runtime.secrets import Secrets
+from IngestConfig import get_secrets
+
+# pro.daily 单次请求返回的最大行数
+DAILY_ROW_LIMIT = 6000
+
+# 本地暂存区写入器，为None时直接写MySQL
+_spool_writer = None
 
 # 初始化Tushare API
-# 注意：需要在环境变量或st.secrets中配置tushare token
+# 注意：需要在环境变量或secrets.toml中配置tushare token（见IngestConfig）
 def init_tushare_api():
     """
     初始化Tushare API
     """
     try:
-        token = st.secrets["tushare"]["token"]
+        token = get_secrets()["tushare"]["token"]
         ts.set_token(token)
         pro = ts.pro_api()
         return pro
@@ -37,6 +44,17 @@ def get_stock_list(pro):
         print(f"获取股票列表失败: {e}")
         return None
 
+def is_trade_day(pro, trade_date):
+    """
+    判断是否为交易日，查询失败时按交易日处理
+    """
+    try:
+        cal = pro.trade_cal(exchange='SSE', start_date=trade_date, end_date=trade_date)
+        return cal is None or cal.empty or int(cal.iloc[0]['is_open']) == 1
+    except Exception as e:
+        print(f"获取交易日历失败: {e}")
+        return True
+
 def get_stock_daily_data(pro, ts_code, start_date, end_date):
     """
     获取单只股票的日线行情数据
@@ -53,17 +71,173 @@ def get_stock_daily_data(pro, ts_code, start_date, end_date):
         print(f"获取{ts_code}日线数据失败: {e}")
         return None
 
+def get_trade_days(pro, start_date, end_date):
+    """
+    获取区间内的交易日列表(升序)，查询失败返回None
+    """
+    try:
+        cal = pro.trade_cal(exchange='SSE', start_date=start_date, end_date=end_date, is_open='1')
+        return sorted(cal['cal_date'].astype(str).tolist())
+    except Exception as e:
+        print(f"获取交易日历失败: {e}")
+        return None
+
+def iter_code_batches(ts_codes, trade_day_count, row_limit=DAILY_ROW_LIMIT):
+    """
+    按 代码数 × 交易日数 不超过单次行数上限，将股票代码打包成批
+    """
+    batch_size = max(1, row_limit // max(trade_day_count, 1))
+    for i in range(0, len(ts_codes), batch_size):
+        yield ts_codes[i:i + batch_size]
+
+def get_stock_daily_data_batch(pro, ts_codes, start_date, end_date, trade_day_count=None,
+                               row_limit=DAILY_ROW_LIMIT):
+    """
+    一次请求获取多只股票的日线数据，按股票检查覆盖情况，
+    缺失的股票（返回被截断或整批请求失败时）逐只补拉
+
+    返回:
+    (合并后的日线数据, 获取失败的股票代码列表)
+    """
+    try:
+        daily_data = pro.daily(ts_code=','.join(ts_codes), start_date=start_date, end_date=end_date)
+    except Exception as e:
+        print(f"批量获取 {ts_codes[0]} 等 {len(ts_codes)} 只股票日线数据失败: {e}")
+        daily_data = None
+
+    if daily_data is None:
+        refetch = list(ts_codes)
+        frames = []
+    else:
+        counts = daily_data['ts_code'].value_counts()
+        # 达到行数上限说明结果可能被截断，行数不足的股票都需要补拉；
+        # 否则只补拉完全没有返回的股票（停牌的股票补拉后同样为空）
+        truncated = len(daily_data) >= row_limit
+        expected = trade_day_count if truncated and trade_day_count else 1
+        refetch = [code for code in ts_codes if counts.get(code, 0) < expected]
+        frames = [daily_data[~daily_data['ts_code'].isin(refetch)]]
+
+    failed = []
+    for ts_code in refetch:
+        single = get_stock_daily_data(pro, ts_code, start_date, end_date)
+        if single is None:
+            failed.append(ts_code)
+        elif not single.empty:
+            frames.append(single)
+    frames = [frame for frame in frames if not frame.empty]
+    if not frames:
+        return pd.DataFrame(), failed
+    return pd.concat(frames, ignore_index=True), failed
+
+def get_db_connection(**kwargs):
+    """
+    按配置创建MySQL连接，kwargs透传给pymysql.connect
+    """
+    mysql = get_secrets()["mysql"]
+    return pymysql.connect(
+        host=mysql["host"],
+        port=int(mysql.get("port", 3306)),
+        user=mysql["user"],
+        password=mysql["password"],
+        database=mysql["database"],
+        **kwargs
+    )
+
+def format_trade_date(value):
+    """
+    交易日统一为YYYYMMDD字符串：stock_daily的trade_date为DATE类型，读出的是date对象
+    """
+    if value is None:
+        return None
+    return value.strftime('%Y%m%d') if hasattr(value, 'strftime') else str(value)
+
+def _month_start(month):
+    """YYYYMM -> 'YYYY-MM-01'"""
+    return f"{month[:4]}-{month[4:6]}-01"
+
+def _next_month(month):
+    year, mon = int(month[:4]), int(month[4:6])
+    return f"{year + mon // 12}{mon % 12 + 1:02d}"
+
+def _month_range(first_month, last_month):
+    months = []
+    month = first_month
+    while month <= last_month:
+        months.append(month)
+        month = _next_month(month)
+    return months
+
+def _partition_sql(month):
+    return f"PARTITION p{month} VALUES LESS THAN ('{_month_start(_next_month(month))}')"
+
+def stock_daily_ddl(table='stock_daily', first_month=None, months_ahead=3, row_format=None):
+    """
+    日线表建表语句：
+    - 主键(ts_code, trade_date)即聚簇索引，另建trade_date二级索引供按日期窗口扫描
+    - trade_date为DATE，价格为DECIMAL(8,2)（A股价格两位小数）
+    - 按月RANGE COLUMNS分区，first_month(YYYYMM，默认约13个月前)之前的数据落在p_old，
+      之后逐月分区并预建months_ahead个月
+    """
+    now = datetime.now().strftime('%Y%m')
+    first_month = first_month or (datetime.now() - timedelta(days=400)).strftime('%Y%m')
+    last_month = now
+    for _ in range(months_ahead):
+        last_month = _next_month(last_month)
+    partitions = [f"PARTITION p_old VALUES LESS THAN ('{_month_start(first_month)}')"]
+    partitions += [_partition_sql(month) for month in _month_range(first_month, last_month)]
+    partitions.append("PARTITION pmax VALUES LESS THAN (MAXVALUE)")
+    partition_sql = ',\n                '.join(partitions)
+    options = f" ROW_FORMAT={row_format}" if row_format else ''
+    return f'''
+            CREATE TABLE IF NOT EXISTS {table} (
+                ts_code VARCHAR(12) NOT NULL,
+                trade_date DATE NOT NULL,
+                open DECIMAL(8, 2),
+                high DECIMAL(8, 2),
+                low DECIMAL(8, 2),
+                close DECIMAL(8, 2),
+                pre_close DECIMAL(8, 2),
+                `change` DECIMAL(8, 2),
+                pct_chg DECIMAL(8, 4),
+                vol DECIMAL(16, 2),
+                amount DECIMAL(18, 3),
+                PRIMARY KEY (ts_code, trade_date),
+                KEY idx_trade_date (trade_date)
+            ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4{options}
+            PARTITION BY RANGE COLUMNS(trade_date) (
+                {partition_sql}
+            )
+        '''
+
+def ensure_partitions(cursor, table='stock_daily', months_ahead=3):
+    """
+    为按月分区的表预建后续月份的分区（从pmax中拆分），未分区的旧表直接跳过
+    """
+    cursor.execute('''
+        SELECT PARTITION_NAME FROM information_schema.PARTITIONS
+        WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s AND PARTITION_NAME LIKE 'p2%%'
+    ''', (table,))
+    months = sorted(row[0][1:] for row in cursor.fetchall())
+    if not months:
+        return
+    target = datetime.now().strftime('%Y%m')
+    for _ in range(months_ahead):
+        target = _next_month(target)
+    new_months = _month_range(_next_month(months[-1]), target)
+    if not new_months:
+        return
+    partitions = ', '.join([_partition_sql(month) for month in new_months] +
+                           ["PARTITION pmax VALUES LESS THAN (MAXVALUE)"])
+    cursor.execute(f"ALTER TABLE {table} REORGANIZE PARTITION pmax INTO ({partitions})")
+    print(f"{table} 已新增分区: {new_months[0]} 至 {new_months[-1]}")
+
 def init_database():
     """
     初始化数据库，创建表结构
     """
     try:
         # 从secrets.toml读取数据库连接信息
-        conn = pymysql.connect(
-            host=st.secrets["mysql"]["host"],
-            user=st.secrets["mysql"]["user"],
-            password=st.secrets["mysql"]["password"],
-            database=st.secrets["mysql"]["database"],
+        conn = get_db_connection(
             charset='utf8mb4',
             autocommit=True,
             connect_timeout=600,
@@ -87,49 +261,9 @@ def init_database():
             ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4
         ''')
         
-        # 创建股票日线行情表
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS stock_daily (
-                id INT PRIMARY KEY AUTO_INCREMENT,
-                ts_code VARCHAR(20),
-                trade_date VARCHAR(20),
-                open DECIMAL(10, 3),
-                high DECIMAL(10, 3),
-                low DECIMAL(10, 3),
-                close DECIMAL(10, 3),
-                pre_close DECIMAL(10, 3),
-                `change` DECIMAL(10, 3),
-                pct_chg DECIMAL(10, 3),
-                vol DECIMAL(20, 3),
-                amount DECIMAL(20, 3),
-                UNIQUE KEY unique_ts_code_date (ts_code, trade_date)
-            ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4
-        ''')
-        
-        # 创建索引以提高查询性能
-        try:
-            cursor.execute('''
-                CREATE INDEX idx_ts_code_date ON stock_daily(ts_code, trade_date)
-            ''')
-        except:
-            # 索引可能已存在，忽略错误
-            pass
-            
-        try:
-            cursor.execute('''
-                CREATE INDEX idx_trade_date ON stock_daily(trade_date)
-            ''')
-        except:
-            # 索引可能已存在，忽略错误
-            pass
-            
-        try:
-            cursor.execute('''
-                CREATE INDEX idx_low_price ON stock_daily(low)
-            ''')
-        except:
-            # 索引可能已存在，忽略错误
-            pass
+        # 创建股票日线行情表（已存在的旧结构表可用 IngestCli.py migrate 在线迁移）
+        cursor.execute(stock_daily_ddl())
+        ensure_partitions(cursor)
         
         cursor.close()
         conn.close()
@@ -150,11 +284,7 @@ def save_stock_basic_to_db(pro, db_path=None):
     
     try:
         # 从secrets.toml读取数据库连接信息
-        conn = pymysql.connect(
-            host=st.secrets["mysql"]["host"],
-            user=st.secrets["mysql"]["user"],
-            password=st.secrets["mysql"]["password"],
-            database=st.secrets["mysql"]["database"],
+        conn = get_db_connection(
             charset='utf8mb4',
             autocommit=True
         )
@@ -182,6 +312,85 @@ def save_stock_basic_to_db(pro, db_path=None):
     except Exception as e:
         print(f"保存股票基本信息时出错: {e}")
 
+def save_daily_frame_to_db(daily_data, label):
+    """
+    将日线数据批量写入stock_daily
+    label: 日志中用于标识这批数据，如ts_code
+
+    返回:
+    是否写入成功
+    """
+    return save_frame_to_table(daily_data, 'stock_daily', label)
+
+def set_spool_writer(writer):
+    """
+    设置本地暂存区（见IngestSpool），设置后save_frame_to_table只写暂存区，由回放进程写入MySQL
+    """
+    global _spool_writer
+    _spool_writer = writer
+
+def save_frame_to_table(frame, table, label):
+    """
+    保存一批数据：启用暂存区时追加到本地段文件，否则直接写入MySQL
+
+    返回:
+    是否保存成功
+    """
+    if _spool_writer is not None:
+        return _spool_writer.append(table, frame, label)
+    return write_frame_to_table(frame, table, label)
+
+def write_frame_to_table(frame, table, label):
+    """
+    将DataFrame批量写入指定表(INSERT IGNORE)，连接类错误按指数退避重试
+    label: 日志中用于标识这批数据
+
+    返回:
+    是否写入成功
+    """
+    try:
+        # 批量插入数据，NaN转为NULL
+        frame = frame.astype(object).where(frame.notna(), None)
+        data_tuples = [tuple(row) for row in frame.values]
+        columns = ','.join([f"`{col}`" for col in frame.columns])
+        placeholders = ','.join(['%s'] * len(frame.columns))
+    except Exception as e:
+        print(f"处理 {label} 数据时出错: {e}")
+        return False
+
+    # 增强重试机制
+    retry_count = 0
+    max_retries = 5
+    while retry_count < max_retries:
+        try:
+            conn = get_db_connection(
+                charset='utf8mb4',
+                autocommit=True,
+                connect_timeout=60,
+                read_timeout=60,
+                write_timeout=60,
+                max_allowed_packet=128*1024*1024  # 128MB
+            )
+
+            cursor = conn.cursor()
+            insert_query = f"INSERT IGNORE INTO {table} ({columns}) VALUES ({placeholders})"
+            cursor.executemany(insert_query, data_tuples)
+            cursor.close()
+            conn.close()
+            return True
+        except (pymysql.OperationalError, pymysql.InterfaceError, pymysql.InternalError) as e:
+            retry_count += 1
+            print(f"数据库连接失败，正在重试 ({retry_count}/{max_retries}): {e}")
+            if retry_count >= max_retries:
+                print(f"达到最大重试次数，保存 {label} 数据失败")
+                return False
+            time.sleep(2 ** retry_count)  # 指数退避
+        except Exception as e:
+            # 非连接错误直接记录并跳出
+            print(f"保存 {label} 数据时发生未预期错误: {e}")
+            return False
+    return False
+
 def save_stock_daily_to_db(pro, days=120, db_path=None):
     """
     保存股票日线数据到数据库
@@ -202,123 +411,89 @@ def save_stock_daily_to_db(pro, days=120, db_path=None):
         return
     
     try:
-        # 从secrets.toml读取数据库连接信息
-        conn = pymysql.connect(
-            host=st.secrets["mysql"]["host"],
-            user=st.secrets["mysql"]["user"],
-            password=st.secrets["mysql"]["password"],
-            database=st.secrets["mysql"]["database"],
-            charset='utf8mb4',
-            autocommit=True
-        )
-        
-        total_stocks = len(stock_list)
+        ts_codes = stock_list['ts_code'].tolist()
+        total_stocks = len(ts_codes)
         print(f"开始获取 {total_stocks} 只股票的历史数据，时间范围: {start_date_str} 至 {end_date_str}")
-        
-        # 逐个获取股票数据并保存
-        for i, (_, stock) in enumerate(stock_list.iterrows()):
-            ts_code = stock['ts_code']
-            print(f"进度: {i+1}/{total_stocks} - 正在获取 {ts_code} 的数据...")
-            
-            # 获取该股票的日线数据
-            daily_data = get_stock_daily_data(pro, ts_code, start_date_str, end_date_str)
-            
-            if daily_data is not None and not daily_data.empty:
-                # 保存到数据库
-                try:
-                    # 批量插入数据
-                    data_tuples = [tuple(row) for row in daily_data.values]
-                    columns = ','.join([f"`{col}`" if col == 'change' else col for col in daily_data.columns])
-                    placeholders = ','.join(['%s'] * len(daily_data.columns))
-                    
-                    # 增强重试机制
-                    retry_count = 0
-                    max_retries = 5
-                    while retry_count < max_retries:
-                        try:
-                            conn = pymysql.connect(
-                                host=st.secrets["mysql"]["host"],
-                                user=st.secrets["mysql"]["user"],
-                                password=st.secrets["mysql"]["password"],
-                                database=st.secrets["mysql"]["database"],
-                                charset='utf8mb4',
-                                autocommit=True,
-                                connect_timeout=60,
-                                read_timeout=60,
-                                write_timeout=60,
-                            )
-                            
-                            cursor = conn.cursor()
-                            insert_query = f"INSERT IGNORE INTO stock_daily ({columns}) VALUES ({placeholders})"
-                            cursor.executemany(insert_query, data_tuples)
-                            cursor.close()
-                            conn.close()
-                            break  # 成功执行则跳出重试循环
-                        except (pymysql.OperationalError, pymysql.InterfaceError, pymysql.InternalError) as e:
-                            retry_count += 1
-                            print(f"数据库连接失败，正在重试 ({retry_count}/{max_retries}): {e}")
-                            if retry_count >= max_retries:
-                                print(f"达到最大重试次数，保存 {ts_code} 数据失败")
-                                break
-                            time.sleep(2 ** retry_count)  # 指数退避
-                        except Exception as e:
-                            # 非连接错误直接记录并跳出
-                            print(f"保存 {ts_code} 数据时发生未预期错误: {e}")
-                            break
-                except Exception as e:
-                    print(f"处理 {ts_code} 数据时出错: {e}")
 
-            else:
-                print(f"未获取到 {ts_code} 的数据")
-            
+        trade_days = get_trade_days(pro, start_date_str, end_date_str)
+        if not trade_days:
+            print("未获取到交易日历，无法确定批次大小")
+            return
+        done = 0
+        failed = []
+        # 多只股票合并为一次请求，代码数 × 交易日数 不超过单次行数上限
+        for i, batch in enumerate(iter_code_batches(ts_codes, len(trade_days))):
+            daily_data, batch_failed = get_stock_daily_data_batch(
+                pro, batch, start_date_str, end_date_str, trade_day_count=len(trade_days))
+            failed.extend(batch_failed)
+            label = f"{batch[0]}~{batch[-1]}"
+            if not daily_data.empty and not save_daily_frame_to_db(daily_data, label):
+                failed.extend(batch)
+            done += len(batch)
+            print(f"进度: {done}/{total_stocks} - {label} 共 {len(daily_data)} 行")
+
             # 控制请求频率，避免被限制
-            if (i + 1) % 100 == 0:
+            if (i + 1) % 50 == 0:
                 print("休息1秒，避免请求过于频繁...")
                 time.sleep(1)
-            
-            # 对于出现错误的股票，额外等待一段时间
-            if daily_data is None or daily_data.empty:
-                print(f"股票 {ts_code} 数据获取失败，短暂等待后继续...")
-                time.sleep(0.5)
+
+        if failed:
+            print(f"{len(failed)} 只股票获取或保存失败: {','.join(failed[:20])}")
     except Exception as e:
         print(f"保存股票数据时出错: {e}")
 
-def update_daily_data(pro, db_path=None):
+def update_daily_data(pro, db_path=None, trade_date=None, missing_only=False):
     """
     每日更新最新数据
+    trade_date: 要更新的交易日(YYYYMMDD)，默认为昨天
+    missing_only: 当日已有部分数据时只补齐缺失的股票，默认已有数据即跳过
     """
+    # 获取昨天的日期
+    yesterday = trade_date or (datetime.now() - timedelta(days=1)).strftime('%Y%m%d')
+
+    # 检查是否已经更新过昨天的数据
     try:
         # 从secrets.toml读取数据库连接信息
-        conn = pymysql.connect(
-            host=st.secrets["mysql"]["host"],
-            user=st.secrets["mysql"]["user"],
-            password=st.secrets["mysql"]["password"],
-            database=st.secrets["mysql"]["database"],
+        conn = get_db_connection(
             charset='utf8mb4',
             autocommit=True
         )
-        
-        # 获取昨天的日期
-        yesterday = (datetime.now() - timedelta(days=1)).strftime('%Y%m%d')
-        
-        # 检查是否已经更新过昨天的数据
         cursor = conn.cursor()
-        cursor.execute("SELECT COUNT(*) as count FROM stock_daily WHERE trade_date = %s", (yesterday,))
-        count = cursor.fetchone()[0]
+        try:
+            # 每日顺带预建后续月份的分区
+            ensure_partitions(cursor)
+        except Exception as e:
+            print(f"预建分区失败: {e}")
+        cursor.execute("SELECT ts_code FROM stock_daily WHERE trade_date = %s", (yesterday,))
+        stored_codes = {row[0] for row in cursor.fetchall()}
         cursor.close()
-        
-        if count > 0:
-            print(f"昨天({yesterday})的数据已存在，无需重复更新")
-            conn.close()
+        conn.close()
+    except Exception as e:
+        if _spool_writer is None:
+            print(f"更新每日数据时出错: {e}")
             return
-        
+        # 启用暂存区时数据库不可用不影响抓取，数据由回放进程写入
+        print(f"数据库暂不可用，跳过已有数据检查，数据写入暂存区: {e}")
+        stored_codes = set()
+
+    if stored_codes and not missing_only:
+        print(f"{yesterday}的数据已存在，无需重复更新")
+        return
+
+    try:
         # 获取股票列表
         stock_list = get_stock_list(pro)
         if stock_list is None or stock_list.empty:
             print("未获取到股票列表数据")
-            conn.close()
             return
         
+        if stored_codes:
+            stock_list = stock_list[~stock_list['ts_code'].isin(stored_codes)]
+            if stock_list.empty:
+                print(f"{yesterday}的数据已完整，无需补齐")
+                return
+            print(f"{yesterday}已有 {len(stored_codes)} 只股票的数据，补齐缺失的 {len(stock_list)} 只")
+
         print(f"开始更新 {yesterday} 的股票数据...")
         
         # 逐个获取股票最新数据并保存
@@ -333,45 +508,7 @@ def update_daily_data(pro, db_path=None):
                 
                 if daily_data is not None and not daily_data.empty:
                     # 保存到数据库，增加重试机制
-                    data_tuples = [tuple(row) for row in daily_data.values]
-                    columns = ','.join([f"`{col}`" if col == 'change' else col for col in daily_data.columns])
-                    placeholders = ','.join(['%s'] * len(daily_data.columns))
-                    
-                    # 增强重试机制
-                    retry_count = 0
-                    max_retries = 5
-                    while retry_count < max_retries:
-                        try:
-                            conn = pymysql.connect(
-                                host=st.secrets["mysql"]["host"],
-                                user=st.secrets["mysql"]["user"],
-                                password=st.secrets["mysql"]["password"],
-                                database=st.secrets["mysql"]["database"],
-                                charset='utf8mb4',
-                                autocommit=True,
-                                connect_timeout=60,
-                                read_timeout=60,
-                                write_timeout=60,
-                                max_allowed_packet=128*1024*1024  # 128MB
-                            )
-                            
-                            cursor = conn.cursor()
-                            insert_query = f"INSERT IGNORE INTO stock_daily ({columns}) VALUES ({placeholders})"
-                            cursor.executemany(insert_query, data_tuples)
-                            cursor.close()
-                            conn.close()
-                            break  # 成功执行则跳出重试循环
-                        except (pymysql.OperationalError, pymysql.InterfaceError, pymysql.InternalError) as e:
-                            retry_count += 1
-                            print(f"数据库连接失败，正在重试 ({retry_count}/{max_retries}): {e}")
-                            if retry_count >= max_retries:
-                                print(f"达到最大重试次数，保存 {ts_code} 数据失败")
-                                break
-                            time.sleep(2 ** retry_count)  # 指数退避
-                        except Exception as e:
-                            #非连接错误直接记录并跳出
-                            print(f"保存 {ts_code} 数据时发生未预期错误: {e}")
-                            break
+                    save_daily_frame_to_db(daily_data, ts_code)
             except Exception as e:
                 print(f"获取 {ts_code} 数据时出错: {e}")
             
@@ -380,7 +517,6 @@ def update_daily_data(pro, db_path=None):
                 print("休息1秒，避免请求过于频繁...")
                 time.sleep(1)
         
-        conn.close()
         print("每日数据更新完成")
     except Exception as e:
         print(f"更新每日数据时出错: {e}")
@@ -396,33 +532,25 @@ def query_stocks_with_double_tail_number(days=6, db_path=None):
     符合条件的股票数据
     """
     try:
-        # 从secrets.toml读取数据库连接信息
-        conn = pymysql.connect(
-            host=st.secrets["mysql"]["host"],
-            user=st.secrets["mysql"]["user"],
-            password=st.secrets["mysql"]["password"],
-            database=st.secrets["mysql"]["database"],
+        # 从secrets.toml读取数据库连接信息；日期查询和结果的流式读取共用这一个连接
+        conn = get_db_connection(
             charset='utf8mb4',
-            autocommit=True
+            autocommit=True,
+            read_timeout=3600
         )
         
-        # 获取最近N个交易日的日期
+        # 获取最近N个交易日的日期，最近3个交易日取其中的前3个
         cursor = conn.cursor()
         cursor.execute('''
             SELECT DISTINCT trade_date 
             FROM stock_daily 
             ORDER BY trade_date DESC 
             LIMIT %s
-        ''', (days,))
+        ''', (max(days, 3),))
         
-        recent_dates = cursor.fetchall()
-        cursor.execute('''
-                    SELECT DISTINCT trade_date 
-                    FROM stock_daily 
-                    ORDER BY trade_date DESC 
-                    LIMIT %s
-                ''', (3,))
-        recent3_dates=cursor.fetchall()
+        all_dates = cursor.fetchall()
+        recent_dates = all_dates[:days]
+        recent3_dates = all_dates[:3]
         cursor.close()
         
         if not recent_dates:
@@ -431,8 +559,8 @@ def query_stocks_with_double_tail_number(days=6, db_path=None):
             return None
         
         # 构造日期条件
-        date_list = [date[0] for date in recent_dates]
-        date3_list=[date[0] for date in recent3_dates]
+        date_list = [format_trade_date(date[0]) for date in recent_dates]
+        date3_list=[format_trade_date(date[0]) for date in recent3_dates]
         # 查询在最近N天内最低价为双尾数的股票
         # 方法：先找出每个股票在最近N天内的最低价，然后筛选出最低价为双尾数的股票
         cursor = conn.cursor()
@@ -463,23 +591,161 @@ def query_stocks_with_double_tail_number(days=6, db_path=None):
         
         # 修复：将两个元组合并为一个元组作为查询参数
         params = tuple(date_list) + tuple(date3_list)
-        cursor.execute(query, params)
-        result = cursor.fetchall()
         cursor.close()
-        
-        # 转换为DataFrame
-        if result:
-            df = pd.DataFrame(result, columns=['name', 'ts_code','low'])
-            conn.close()
-            return df
-        else:
+
+        # 流式读取结果并逐块拼接，拼接后的块即可释放，不同时持有全部块
+        result = None
+        try:
+            for chunk in iter_query_chunks(query, params, columns=['name', 'ts_code', 'low'], conn=conn):
+                result = chunk if result is None else pd.concat([result, chunk], ignore_index=True)
+        finally:
             conn.close()
-            return pd.DataFrame()
+        return result if result is not None else pd.DataFrame()
             
     except Exception as e:
         print(f"查询双尾数股票时出错: {e}")
         return None
 
+def iter_query_chunks(query, params=None, chunksize=50000, columns=None, as_arrow=False, conn=None):
+    """
+    通过服务端游标(SSCursor)流式读取查询结果，按块返回，不在内存中保留完整结果集
+
+    参数:
+    query: SQL语句（使用%s占位符）
+    params: 查询参数
+    chunksize: 每块的行数
+    columns: 列名，默认取查询结果的列名
+    as_arrow: 为True时返回pyarrow.RecordBatch，否则返回DataFrame
+    conn: 已有的数据库连接，读取完成后由调用方关闭；默认新建连接并在结束时关闭
+
+    返回:
+    生成器，DECIMAL列转换为float64，DATE列转换为YYYYMMDD字符串
+    """
+    own_conn = conn is None
+    if own_conn:
+        conn = get_db_connection(
+            charset='utf8mb4',
+            autocommit=True,
+            read_timeout=3600,
+            cursorclass=pymysql.cursors.SSCursor
+        )
+    cursor = conn.cursor(pymysql.cursors.SSCursor)
+    try:
+        cursor.execute(query, params)
+        names = columns or [desc[0] for desc in cursor.description]
+        # 按列类型决定需要转换为float的列（DECIMAL/NEWDECIMAL）
+        decimal_types = (FIELD_TYPE.DECIMAL, FIELD_TYPE.NEWDECIMAL)
+        decimal_columns = [names[i] for i, desc in enumerate(cursor.description) if desc[1] in decimal_types]
+        # DATE列转换为YYYYMMDD字符串，与tushare返回的格式一致
+        date_types = (FIELD_TYPE.DATE, FIELD_TYPE.NEWDATE)
+        date_columns = [names[i] for i, desc in enumerate(cursor.description) if desc[1] in date_types]
+        while True:
+            rows = cursor.fetchmany(chunksize)
+            if not rows:
+                break
+            df = pd.DataFrame.from_records(rows, columns=names)
+            for col in decimal_columns:
+                df[col] = pd.to_numeric(df[col], errors='coerce').astype('float64')
+            for col in date_columns:
+                df[col] = df[col].map(format_trade_date)
+            if as_arrow:
+                import pyarrow as pa
+                yield pa.RecordBatch.from_pandas(df, preserve_index=False)
+            else:
+                yield df
+    finally:
+        if own_conn:
+            # 未读完的结果由服务端丢弃，直接关闭连接比逐行排空更快
+            conn.close()
+        else:
+            # 共用的连接需要读完剩余结果才能继续使用
+            cursor.close()
+
+def dump_stock_daily(path, start_date, end_date, chunksize=100000):
+    """
+    将日期范围内的日线数据流式导出为CSV，内存占用与导出行数无关
+    已归档的历史数据从归档表读取（见DailyTiering）
+
+    返回:
+    导出的行数
+    """
+    from DailyTiering import read_daily
+    total = 0
+    first = True
+    with open(path, 'w', encoding='utf-8-sig', newline='') as f:
+        for chunk in read_daily(start_date, end_date, chunksize=chunksize):
+            chunk.to_csv(f, index=False, header=first)
+            first = False
+            total += len(chunk)
+            print(f"已导出 {total} 行")
+    return total
+
+def query_min_low_before(trade_date, days):
+    """
+    查询trade_date之前最近N个交易日内每只股票的最低价，供盘中筛选作为历史基线
+
+    返回:
+    DataFrame(ts_code, name, min_low)，出错时返回None
+    """
+    try:
+        conn = get_db_connection(
+            charset='utf8mb4',
+            autocommit=True
+        )
+        cursor = conn.cursor()
+        cursor.execute('''
+            SELECT DISTINCT trade_date
+            FROM stock_daily
+            WHERE trade_date < %s
+            ORDER BY trade_date DESC
+            LIMIT %s
+        ''', (trade_date, days))
+        date_list = [format_trade_date(date[0]) for date in cursor.fetchall()]
+        if not date_list:
+            cursor.close()
+            conn.close()
+            return pd.DataFrame(columns=['ts_code', 'name', 'min_low'])
+
+        format_strings = ','.join(['%s'] * len(date_list))
+        cursor.execute(f'''
+            SELECT d.ts_code, s.name, MIN(d.low) AS min_low
+            FROM stock_daily d
+            LEFT JOIN stock_basic s ON d.ts_code = s.ts_code
+            WHERE d.trade_date IN ({format_strings})
+            GROUP BY d.ts_code, s.name
+        ''', tuple(date_list))
+        result = cursor.fetchall()
+        cursor.close()
+        conn.close()
+        return pd.DataFrame(list(result), columns=['ts_code', 'name', 'min_low'])
+    except Exception as e:
+        print(f"查询历史最低价时出错: {e}")
+        return None
+
+def verify_daily_data(trade_date):
+    """
+    检查指定交易日的日线数据覆盖情况
+
+    返回:
+    (该交易日日线记录数, 股票基本信息中的股票数)，出错时返回None
+    """
+    try:
+        conn = get_db_connection(
+            charset='utf8mb4',
+            autocommit=True
+        )
+        cursor = conn.cursor()
+        cursor.execute("SELECT COUNT(*) FROM stock_daily WHERE trade_date = %s", (trade_date,))
+        daily_count = cursor.fetchone()[0]
+        cursor.execute("SELECT COUNT(*) FROM stock_basic")
+        stock_count = cursor.fetchone()[0]
+        cursor.close()
+        conn.close()
+        return daily_count, stock_count
+    except Exception as e:
+        print(f"检查 {trade_date} 日线数据时出错: {e}")
+        return None
+
 # 主函数示例
 def main():
     """
@@ -0,0 +1,348 @@
+"""
+回填任务队列：多台机器上的worker以租约方式领取 (ts_code范围, 日期范围) 任务
+
+worker领取任务后定期续约，完成后标记done；worker崩溃时租约到期，任务会被其他worker重新领取。
+提供两种实现：MySQL表（多机共享）和本地JSON文件（单机多进程或测试用）。
+"""
+import json
+import os
+import socket
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+
+import pymysql
+
+DEFAULT_LEASE_SECONDS = 300
+DEFAULT_MAX_ATTEMPTS = 5
+DEFAULT_CODES_PER_TASK = 200
+
+
+def make_worker_id():
+    """worker标识：主机名+进程号"""
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+def plan_backfill_tasks(ts_codes, start_date, end_date, codes_per_task=DEFAULT_CODES_PER_TASK):
+    """
+    将股票代码按排序后的区间切分为任务
+
+    返回:
+    任务字典列表，每个任务覆盖 [ts_code_start, ts_code_end] 和 [start_date, end_date]
+    """
+    codes = sorted(ts_codes)
+    tasks = []
+    for i in range(0, len(codes), codes_per_task):
+        batch = codes[i:i + codes_per_task]
+        tasks.append({
+            'ts_code_start': batch[0],
+            'ts_code_end': batch[-1],
+            'start_date': start_date,
+            'end_date': end_date,
+        })
+    return tasks
+
+
+class MySqlTaskQueue:
+    """基于MySQL表ingest_task的任务队列，领取依赖单条UPDATE的原子性"""
+
+    def __init__(self, job, max_attempts=DEFAULT_MAX_ATTEMPTS):
+        self.job = job
+        self.max_attempts = max_attempts
+
+    def _connect(self):
+        from TushareData import get_db_connection
+        return get_db_connection(charset='utf8mb4', autocommit=True, connect_timeout=60,
+                                 read_timeout=60, write_timeout=60)
+
+    def _execute(self, sql, params=None, fetch=False):
+        conn = self._connect()
+        try:
+            cursor = conn.cursor(pymysql.cursors.DictCursor)
+            affected = cursor.execute(sql, params)
+            result = cursor.fetchall() if fetch else affected
+            cursor.close()
+            return result
+        finally:
+            conn.close()
+
+    def init(self):
+        self._execute('''
+            CREATE TABLE IF NOT EXISTS ingest_task (
+                id INT PRIMARY KEY AUTO_INCREMENT,
+                job VARCHAR(50) NOT NULL,
+                ts_code_start VARCHAR(20) NOT NULL,
+                ts_code_end VARCHAR(20) NOT NULL,
+                start_date VARCHAR(20) NOT NULL,
+                end_date VARCHAR(20) NOT NULL,
+                status VARCHAR(10) NOT NULL DEFAULT 'pending',
+                owner VARCHAR(150),
+                lease_until DATETIME,
+                attempts INT NOT NULL DEFAULT 0,
+                last_error VARCHAR(1000),
+                update_time DATETIME,
+                KEY idx_job_status_lease (job, status, lease_until)
+            ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4
+        ''')
+
+    def add_tasks(self, tasks):
+        conn = self._connect()
+        try:
+            cursor = conn.cursor()
+            cursor.executemany('''
+                INSERT INTO ingest_task (job, ts_code_start, ts_code_end, start_date, end_date, update_time)
+                VALUES (%s, %s, %s, %s, %s, NOW())
+            ''', [(self.job, t['ts_code_start'], t['ts_code_end'], t['start_date'], t['end_date']) for t in tasks])
+            cursor.close()
+        finally:
+            conn.close()
+
+    def claim(self, worker_id, lease_seconds=DEFAULT_LEASE_SECONDS):
+        """领取一个待处理或租约已过期的任务，没有可领取任务时返回None"""
+        # 超过最大尝试次数且租约过期的任务不再重发
+        self._execute('''
+            UPDATE ingest_task SET status = 'failed', update_time = NOW()
+            WHERE job = %s AND status = 'running' AND lease_until < NOW() AND attempts >= %s
+        ''', (self.job, self.max_attempts))
+        token = f"{worker_id}:{uuid.uuid4().hex[:8]}"
+        claimed = self._execute('''
+            UPDATE ingest_task
+            SET status = 'running', owner = %s, lease_until = NOW() + INTERVAL %s SECOND,
+                attempts = attempts + 1, update_time = NOW()
+            WHERE job = %s AND (status = 'pending' OR (status = 'running' AND lease_until < NOW()))
+            ORDER BY id LIMIT 1
+        ''', (token, lease_seconds, self.job))
+        if not claimed:
+            return None
+        rows = self._execute("SELECT * FROM ingest_task WHERE owner = %s AND status = 'running'", (token,), fetch=True)
+        if not rows:
+            return None
+        task = rows[0]
+        task['token'] = token
+        return task
+
+    def heartbeat(self, task, lease_seconds=DEFAULT_LEASE_SECONDS):
+        """续约，返回False表示租约已被他人接管"""
+        return self._execute('''
+            UPDATE ingest_task SET lease_until = NOW() + INTERVAL %s SECOND, update_time = NOW()
+            WHERE id = %s AND owner = %s AND status = 'running'
+        ''', (lease_seconds, task['id'], task['token'])) > 0
+
+    def complete(self, task):
+        return self._execute('''
+            UPDATE ingest_task SET status = 'done', lease_until = NULL, update_time = NOW()
+            WHERE id = %s AND owner = %s AND status = 'running'
+        ''', (task['id'], task['token'])) > 0
+
+    def release(self, task, error):
+        """处理失败，放回队列等待重试"""
+        status_sql = "IF(attempts >= %s, 'failed', 'pending')"
+        return self._execute(f'''
+            UPDATE ingest_task SET status = {status_sql}, owner = NULL, lease_until = NULL,
+                   last_error = %s, update_time = NOW()
+            WHERE id = %s AND owner = %s AND status = 'running'
+        ''', (self.max_attempts, str(error)[:1000], task['id'], task['token'])) > 0
+
+    def stats(self):
+        rows = self._execute("SELECT status, COUNT(*) AS cnt FROM ingest_task WHERE job = %s GROUP BY status",
+                             (self.job,), fetch=True)
+        return {row['status']: row['cnt'] for row in rows}
+
+
+@contextmanager
+def file_lock(path):
+    # 跨进程文件锁，兼容Windows与POSIX
+    with open(path, 'a+') as f:
+        if os.name == 'nt':
+            import msvcrt
+            f.seek(0)
+            while True:
+                try:
+                    msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+                    break
+                except OSError:
+                    time.sleep(0.05)
+            try:
+                yield
+            finally:
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+        else:
+            import fcntl
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+
+
+class FileTaskQueue:
+    """基于本地JSON文件的任务队列，语义与MySqlTaskQueue相同，适用于单机多进程"""
+
+    def __init__(self, path, max_attempts=DEFAULT_MAX_ATTEMPTS):
+        self.path = path
+        self.lock_path = path + '.lock'
+        self.max_attempts = max_attempts
+
+    def _load(self):
+        if not os.path.exists(self.path):
+            return []
+        with open(self.path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+
+    def _save(self, tasks):
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(tasks, f, ensure_ascii=False)
+        os.replace(tmp_path, self.path)
+
+    @contextmanager
+    def _tasks(self):
+        with file_lock(self.lock_path):
+            tasks = self._load()
+            yield tasks
+            self._save(tasks)
+
+    def _find(self, tasks, task):
+        for t in tasks:
+            if t['id'] == task['id'] and t['owner'] == task['token'] and t['status'] == 'running':
+                return t
+        return None
+
+    def init(self):
+        directory = os.path.dirname(os.path.abspath(self.path))
+        os.makedirs(directory, exist_ok=True)
+        with self._tasks():
+            pass
+
+    def add_tasks(self, tasks):
+        with self._tasks() as existing:
+            next_id = max([t['id'] for t in existing], default=0) + 1
+            for i, t in enumerate(tasks):
+                existing.append(dict(t, id=next_id + i, status='pending', owner=None,
+                                     lease_until=None, attempts=0, last_error=None))
+
+    def claim(self, worker_id, lease_seconds=DEFAULT_LEASE_SECONDS):
+        now = time.time()
+        with self._tasks() as tasks:
+            for t in tasks:
+                expired = t['status'] == 'running' and t['lease_until'] < now
+                if expired and t['attempts'] >= self.max_attempts:
+                    t['status'] = 'failed'
+                    continue
+                if t['status'] == 'pending' or expired:
+                    t.update(status='running', owner=f"{worker_id}:{uuid.uuid4().hex[:8]}",
+                             lease_until=now + lease_seconds, attempts=t['attempts'] + 1)
+                    return dict(t, token=t['owner'])
+        return None
+
+    def heartbeat(self, task, lease_seconds=DEFAULT_LEASE_SECONDS):
+        with self._tasks() as tasks:
+            t = self._find(tasks, task)
+            if t is None:
+                return False
+            t['lease_until'] = time.time() + lease_seconds
+            return True
+
+    def complete(self, task):
+        with self._tasks() as tasks:
+            t = self._find(tasks, task)
+            if t is None:
+                return False
+            t.update(status='done', lease_until=None)
+            return True
+
+    def release(self, task, error):
+        with self._tasks() as tasks:
+            t = self._find(tasks, task)
+            if t is None:
+                return False
+            t.update(status='failed' if t['attempts'] >= self.max_attempts else 'pending',
+                     owner=None, lease_until=None, last_error=str(error)[:1000])
+            return True
+
+    def stats(self):
+        with file_lock(self.lock_path):
+            tasks = self._load()
+        result = {}
+        for t in tasks:
+            result[t['status']] = result.get(t['status'], 0) + 1
+        return result
+
+
+def open_queue(spec, job):
+    """
+    根据spec打开队列：'mysql' 或 'file:<路径>'
+    """
+    if spec.startswith('file:'):
+        return FileTaskQueue(spec[len('file:'):])
+    return MySqlTaskQueue(job)
+
+
+class LeaseKeeper:
+    """后台线程定期续约，续约失败时置lost标志"""
+
+    def __init__(self, queue, task, lease_seconds=DEFAULT_LEASE_SECONDS):
+        self.queue = queue
+        self.task = task
+        self.lease_seconds = lease_seconds
+        self.lost = threading.Event()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        interval = max(self.lease_seconds / 3, 1)
+        while not self._stop.wait(interval):
+            try:
+                if not self.queue.heartbeat(self.task, self.lease_seconds):
+                    self.lost.set()
+                    return
+            except Exception as e:
+                # 暂时性错误不放弃，租约到期前还有两次续约机会
+                print(f"任务 {self.task['id']} 续约失败: {e}")
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+
+
+def run_worker(queue, process_task, worker_id=None, lease_seconds=DEFAULT_LEASE_SECONDS,
+               follow=False, poll_interval=30):
+    """
+    循环领取并执行任务
+
+    参数:
+    queue: MySqlTaskQueue 或 FileTaskQueue
+    process_task: 函数 process_task(task, lease_lost)，lease_lost为threading.Event，
+                  被置位时应尽快停止处理
+    follow: 队列为空时是否继续等待新任务
+    """
+    worker_id = worker_id or make_worker_id()
+    done = 0
+    while True:
+        task = queue.claim(worker_id, lease_seconds)
+        if task is None:
+            if not follow:
+                print(f"[{worker_id}] 队列已无可领取任务，共完成 {done} 个任务")
+                return done
+            time.sleep(poll_interval)
+            continue
+
+        print(f"[{worker_id}] 领取任务 {task['id']}: {task['ts_code_start']}~{task['ts_code_end']} "
+              f"{task['start_date']}~{task['end_date']} (第{task['attempts']}次)")
+        with LeaseKeeper(queue, task, lease_seconds) as keeper:
+            try:
+                process_task(task, keeper.lost)
+            except Exception as e:
+                print(f"[{worker_id}] 任务 {task['id']} 失败: {e}")
+                queue.release(task, e)
+                continue
+        if keeper.lost.is_set():
+            print(f"[{worker_id}] 任务 {task['id']} 租约已丢失，放弃")
+        elif queue.complete(task):
+            done += 1
@@ -0,0 +1,53 @@
+import os
+
+import pandas as pd
+
+import TushareData
+from IngestSpool import SpoolWriter, list_segments, read_segment, replay_segment
+
+
+def _daily(rows):
+    return pd.DataFrame(rows, columns=['ts_code', 'trade_date', 'low'])
+
+
+def _write_segment(spool_dir, frames):
+    writer = SpoolWriter(str(spool_dir), segment_seconds=3600)
+    for frame in frames:
+        assert writer.append('stock_daily', frame, 'test')
+    writer.close()
+    (path,) = list_segments(str(spool_dir))
+    return path
+
+
+def test_torn_last_record_is_skipped(tmp_path):
+    path = _write_segment(tmp_path, [_daily([('000001.SZ', '20250102', 1.33)]),
+                                     _daily([('000002.SZ', '20250102', 2.22)])])
+    # 模拟写入最后一条记录时进程崩溃
+    with open(path, 'r+b') as f:
+        f.truncate(os.path.getsize(path) - 10)
+    records = read_segment(path)
+    assert len(records) == 1
+    assert records[0]['frame']['ts_code'].tolist() == ['000001.SZ']
+
+
+def test_replay_dedups_by_key(tmp_path, monkeypatch):
+    written = []
+    monkeypatch.setattr(TushareData, 'write_frame_to_table',
+                        lambda frame, table, label: written.append((table, frame.copy())) or True)
+    path = _write_segment(tmp_path, [_daily([('000001.SZ', '20250102', 1.50), ('000002.SZ', '20250102', 2.22)]),
+                                     _daily([('000001.SZ', '20250102', 1.33)])])
+    assert replay_segment(path) == 2
+    assert not os.path.exists(path)
+    (table, frame), = written
+    assert table == 'stock_daily'
+    # 同一主键保留最后写入的一行
+    assert sorted(frame.itertuples(index=False, name=None)) == [('000001.SZ', '20250102', 1.33),
+                                                                ('000002.SZ', '20250102', 2.22)]
+
+
+def test_failed_write_keeps_segment(tmp_path, monkeypatch):
+    monkeypatch.setattr(TushareData, 'write_frame_to_table', lambda frame, table, label: False)
+    path = _write_segment(tmp_path, [_daily([('000001.SZ', '20250102', 1.33)])])
+    assert replay_segment(path) is None
+    assert os.path.exists(path)
+    assert len(read_segment(path)) == 1
@@ -0,0 +1,87 @@
+import gc
+import time
+
+import pandas as pd
+
+from IntradayScreen import DoubleTailTracker, IntradaySession
+
+
+def _baseline(rows):
+    return pd.DataFrame(rows, columns=['ts_code', 'name', 'min_low'])
+
+
+def _quotes(rows):
+    return pd.DataFrame(rows, columns=['ts_code', 'low'])
+
+
+def test_candidates_evaluated_before_first_tick():
+    baseline_n = _baseline([('000001.SZ', '甲', 1.33), ('000002.SZ', '乙', 2.50)])
+    baseline_3 = _baseline([('000001.SZ', '甲', 1.33), ('000002.SZ', '乙', 2.50)])
+    tracker = DoubleTailTracker(baseline_n, baseline_3, '20250102')
+    assert tracker.candidates == {'000001.SZ': 133}
+    assert tracker.snapshot().to_dict('records') == [{'name': '甲', 'ts_code': '000001.SZ', 'low': 1.33}]
+
+
+def test_missing_quote_keeps_baseline_candidate():
+    baseline_n = _baseline([('000001.SZ', '甲', 1.33), ('000002.SZ', '乙', 3.10)])
+    baseline_3 = _baseline([('000001.SZ', '甲', 1.33), ('000002.SZ', '乙', 3.10)])
+    tracker = DoubleTailTracker(baseline_n, baseline_3, '20250102')
+    # 000001.SZ 停牌没有行情，000002.SZ 报价为0视为无效
+    added, removed = tracker.update(_quotes([('000002.SZ', 0.0)]))
+    assert (added, removed) == ([], [])
+    assert '000001.SZ' in tracker.candidates
+
+
+def test_new_low_adds_and_removes_candidates():
+    baseline_n = _baseline([('000001.SZ', '甲', 1.33), ('000002.SZ', '乙', 2.50)])
+    baseline_3 = _baseline([('000001.SZ', '甲', 1.33), ('000002.SZ', '乙', 2.50)])
+    tracker = DoubleTailTracker(baseline_n, baseline_3, '20250102')
+    events = []
+    tracker.subscribe(lambda added, removed: events.append((added, removed)))
+
+    added, removed = tracker.update(_quotes([('000001.SZ', 1.30), ('000002.SZ', 2.22)]))
+    assert added == ['000002.SZ'] and removed == ['000001.SZ']
+    assert tracker.candidates == {'000002.SZ': 222}
+    assert events == [(['000002.SZ'], ['000001.SZ'])]
+
+    # 最低价没有下降的行情不触发重新评估
+    assert tracker.update(_quotes([('000002.SZ', 2.40)])) == ([], [])
+    assert tracker.version == 1
+
+
+def test_min_of_n_days_must_match_recent_three_days():
+    # N日最低价出现在3日窗口之外时不是候选
+    baseline_n = _baseline([('000001.SZ', '甲', 1.11)])
+    baseline_3 = _baseline([('000001.SZ', '甲', 1.50)])
+    tracker = DoubleTailTracker(baseline_n, baseline_3, '20250102')
+    assert tracker.candidates == {}
+    tracker.update(_quotes([('000001.SZ', 0.99)]))
+    assert tracker.candidates == {'000001.SZ': 99}
+
+
+class _ListSource:
+    def __init__(self, batches):
+        self.batches = list(batches)
+        self.finished = False
+
+    def poll(self):
+        return self.batches.pop(0) if self.batches else None
+
+
+def test_session_records_changes_and_stops_when_released():
+    baseline_n = _baseline([('000001.SZ', '甲', 1.33), ('000002.SZ', '乙', 2.50)])
+    baseline_3 = _baseline([('000001.SZ', '甲', 1.33), ('000002.SZ', '乙', 2.50)])
+    tracker = DoubleTailTracker(baseline_n, baseline_3, '20250102')
+    session = IntradaySession(tracker, _ListSource([_quotes([('000002.SZ', 2.22)])]), interval=0.01)
+    poller = session.poller
+    for _ in range(200):
+        if session.changes:
+            break
+        time.sleep(0.01)
+    assert session.changes[0][1:] == (['000002.SZ'], [])
+
+    # 缓存淘汰后会话对象被回收，轮询线程随之退出
+    del session
+    gc.collect()
+    poller._thread.join(timeout=1)
+    assert not poller.running
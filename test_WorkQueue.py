@@ -0,0 +1,50 @@
+from WorkQueue import FileTaskQueue
+
+
+def _queue(tmp_path, max_attempts=5):
+    queue = FileTaskQueue(str(tmp_path / 'tasks.json'), max_attempts=max_attempts)
+    queue.init()
+    queue.add_tasks([{'ts_code_start': '000001.SZ', 'ts_code_end': '000100.SZ',
+                      'start_date': '20250101', 'end_date': '20250131'}])
+    return queue
+
+
+def test_expired_lease_is_reissued(tmp_path):
+    queue = _queue(tmp_path)
+    first = queue.claim('worker-a', lease_seconds=-1)
+    # 租约已过期，任务重新发给其他worker，尝试次数累加
+    second = queue.claim('worker-b')
+    assert second['id'] == first['id']
+    assert second['attempts'] == 2
+    assert second['token'] != first['token']
+    assert queue.claim('worker-c') is None
+
+
+def test_task_fails_after_max_attempts(tmp_path):
+    queue = _queue(tmp_path, max_attempts=2)
+    queue.claim('worker-a', lease_seconds=-1)
+    queue.claim('worker-b', lease_seconds=-1)
+    # 第二次租约也过期后不再重发
+    assert queue.claim('worker-c') is None
+    assert queue.stats() == {'failed': 1}
+
+
+def test_release_fails_after_max_attempts(tmp_path):
+    queue = _queue(tmp_path, max_attempts=2)
+    assert queue.release(queue.claim('worker-a'), 'boom')
+    assert queue.stats() == {'pending': 1}
+    assert queue.release(queue.claim('worker-a'), 'boom')
+    assert queue.stats() == {'failed': 1}
+
+
+def test_stale_token_is_rejected(tmp_path):
+    queue = _queue(tmp_path)
+    stale = queue.claim('worker-a', lease_seconds=-1)
+    current = queue.claim('worker-b')
+    # 原worker的租约已被接管，续约、完成和放回都不生效
+    assert not queue.heartbeat(stale)
+    assert not queue.complete(stale)
+    assert not queue.release(stale, 'boom')
+    assert queue.heartbeat(current)
+    assert queue.complete(current)
+    assert queue.stats() == {'done': 1}